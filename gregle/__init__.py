@@ -1,5 +1,16 @@
-from . import gcal, lu
-from .event import Event
+from typing import TYPE_CHECKING
+
+from . import lazy
 from .log import log
 
+if TYPE_CHECKING:
+    from . import cache, event, gcal, lu, metrics, path, sync, tz
+    from .event import Event
+
+__getattr__, __dir__ = lazy.attach(
+    __name__,
+    ["cache", "event", "gcal", "lu", "metrics", "path", "sync", "tz"],
+    {"Event": ("event", "Event")},
+)
+
 __all__ = ["Event", "gcal", "lu", "log"]
@@ -1,10 +1,17 @@
 import argparse
+import asyncio
 import datetime
+import functools
 import logging.config
+import time
 from collections.abc import Iterable, Iterator
 from pathlib import Path
 
 import gregle
+import gregle.sync
+from gregle.lu.address import FILE as ROOMS_FILE
+from gregle.lu.address import directory as room_directory
+from gregle.metrics import metrics
 
 
 def log_config(level: int) -> None:
@@ -49,42 +56,126 @@ def events_remote(
     api: gregle.gcal.service.API,
     calendar: str,
     date_range: tuple[datetime.date, datetime.date],
-) -> list[gregle.gcal.Event]:
-    return list(gregle.gcal.cal.get_events(api, calendar, *date_range))
+    incremental: bool = True,
+    cache_dir: Path | None = None,
+) -> Iterator[gregle.gcal.Event]:
+    """Stream the remote events overlapping `date_range`, as their pages arrive.
 
+    Incrementally, the events changed since the last sync arrive first and the mirror is saved once all have arrived,
+    see `gcal.mirror.stream`."""
+    if incremental:
+        filepath = gregle.gcal.mirror.filepath(calendar, cache_dir)
+        mirror = gregle.gcal.mirror.Mirror.load(filepath, calendar)
+        events = gregle.gcal.mirror.stream(api, mirror, *date_range)
+    else:
+        events = gregle.gcal.cal.get_events(api, calendar, *date_range)
+    count = 0
+    for event in metrics.iterate("fetch", events):
+        count += 1
+        yield event
+    if incremental:
+        mirror.save(filepath)
+    metrics.set("gregle_events", count, source="remote")
 
-def events_local(cache: bool = True) -> tuple[list[gregle.lu.Events], tuple[datetime.date, datetime.date]]:
+
+def events_local(
+    cache: bool = True, backend: "gregle.lu.ri.Backend" = "html", workers: int = 0, browser: bool = False
+) -> tuple[list[gregle.lu.Events], tuple[datetime.date, datetime.date]]:
     gregle.log.info("Loading events from LU timetable...")
-    events = gregle.lu.events(True) if cache else gregle.lu.events.write(False)
-    gregle.log.info("Loaded %d LU events over %d dates", len(events), sum(len(e.on_dates) for e in events))
+    store = (
+        gregle.lu.events(True, backend, workers, browser)
+        if cache
+        else gregle.lu.events.write(False, backend, workers, browser)
+    )
+    events = list(store)
+    n_dates = sum(len(e.on_dates) for e in events)
+    gregle.log.info("Loaded %d LU events over %d dates", len(events), n_dates)
+    metrics.set("gregle_events", len(events), source="local")
+    metrics.set("gregle_event_dates", n_dates, source="local")
+    if unmapped := room_directory().unmapped(room for e in events for room in e.instance.rooms):
+        gregle.log.warning(
+            "%d rooms have no address, add them to %s: %s", len(unmapped), ROOMS_FILE, ", ".join(unmapped)
+        )
     dates = gregle.event.datespan(events)
     gregle.log.info("LU events span %s to %s", *dates)
     events.sort(key=lambda e: e.time_start())
     return events, dates
 
 
-def gcal_to_lu(
-    api: gregle.gcal.service.API,
-    calendar: gregle.gcal.service.Calendar,
-    events: Iterable[gregle.gcal.Event],
-    dry_run: bool = True,
-) -> Iterator[gregle.lu.Events]:
-    failed: list[gregle.gcal.Event] = []
-    for event in events:
-        try:
-            yield gregle.lu.Events.from_event(event)
-        except Exception as exc:
-            gregle.log.error("Failed to convert event %s", event, exc_info=exc)
-            failed.append(event)
-    for event in failed:
-        gregle.log.info("Deleting corrupt event %s", event)
-        if eid := event.id():
-            try:
-                gregle.gcal.cal.post_delete(api, calendar, eid, dry_run=dry_run)
-            except Exception as exc:
-                gregle.log.error("Failed to delete event %s", event, exc_info=exc)
-        else:
-            gregle.log.error("Event %s has no ID", event)
+def stream_changes(
+    remote: Iterable[gregle.gcal.Event],
+    local: list[gregle.lu.Events],
+    deferred: list[gregle.event.Diff[gregle.Event]],
+    window: tuple[datetime.date, datetime.date] | None = None,
+) -> Iterator[gregle.event.Diff[gregle.Event]]:
+    """Diff the remote events against the `local` events as they arrive, yielding each update as soon as it is known.
+
+    Remote events with the same content as a local event are not decoded.
+    An event updated while the remote events are listed can be listed again, so only the first listing of it is used.
+    The changes that can only be known once every remote event has been seen, deletions and creations,
+    are added to `deferred` when `remote` is exhausted. They must be applied after the updates have completed.
+    With a `window`, only the dates in it are changed, see `lu.StreamingDiff`."""
+    # Matching and decoding the remote events is the convert stage, the rest is the diff stage
+    start = time.perf_counter()
+    index = gregle.gcal.event.FingerprintIndex(local)
+    checkpoint = time.perf_counter()
+    differ = gregle.lu.StreamingDiff(local, window)
+    seen: set[str] = set()
+    convert, diff = checkpoint - start, time.perf_counter() - checkpoint
+
+    for event in remote:
+        if (eid := event.id()) in seen:
+            continue
+        start = time.perf_counter()
+        if eid is not None:
+            seen.add(eid)
+        decoded: gregle.lu.Events | None = None
+        if (match := index.pop(event)) is None:
+            if index.stale(event) and (window is None or within(event, window)):
+                deferred.append(("delete", event))
+            else:
+                try:
+                    decoded = gregle.lu.Events.from_event(event)
+                except Exception as exc:
+                    gregle.log.error("Failed to convert event %s", event, exc_info=exc)
+                    deferred.append(("delete", event))
+        checkpoint = time.perf_counter()
+        changes: list[gregle.event.Diff[gregle.Event]] = []
+        if match is not None:
+            differ.match(match)
+        elif decoded is not None:
+            changes.extend(differ.add(decoded))
+        convert += checkpoint - start
+        diff += time.perf_counter() - checkpoint
+        yield from changes
+
+    start = time.perf_counter()
+    deferred.extend(differ.finish())
+    diff += time.perf_counter() - start
+    metrics.observe("gregle_stage_seconds", convert, stage="convert")
+    metrics.observe("gregle_stage_seconds", diff, stage="diff")
+
+
+def within(event: gregle.Event, window: tuple[datetime.date, datetime.date]) -> bool:
+    """Whether every date of the `event` is in the `window`."""
+    start, end = window
+    return all(start <= date < end for date in (event.time_start().date(), *event.occurrences()))
+
+
+def sync_window(
+    ns: argparse.Namespace, date_range: tuple[datetime.date, datetime.date]
+) -> tuple[datetime.date, datetime.date] | None:
+    """The window of dates to sync chosen on the command line, `None` to sync every date."""
+    if ns.start is None and ns.end is None and ns.weeks is None:
+        return None
+    start = ns.start or datetime.datetime.now(gregle.tz.DEFAULT).date()
+    if ns.end is not None:
+        end = ns.end + datetime.timedelta(days=1)
+    elif ns.weeks is not None:
+        end = start + datetime.timedelta(weeks=ns.weeks)
+    else:
+        end = date_range[1]
+    return start, end
 
 
 def cli() -> argparse.Namespace:
@@ -92,10 +183,54 @@ def cli() -> argparse.Namespace:
 
     parser.add_argument("--force", action="store_true", help="Force update GCals events from LU")
     parser.add_argument("--dry-run", action="store_true", help="Do not make any changes to Google Calendar")
+    parser.add_argument("--batch", action="store_true", help="Send changes to Google Calendar in batched requests")
+    parser.add_argument(
+        "-j", "--workers", type=int, default=0, help="Send changes to Google Calendar concurrently on N threads"
+    )
     parser.add_argument("--no-cache", dest="cache", action="store_false", help="Do not use cached data")
+    window = parser.add_argument_group("window", "Only sync the events on these dates, the rest are left untouched")
+    window.add_argument(
+        "--from", dest="start", type=datetime.date.fromisoformat, metavar="DATE", help="First date, defaults to today"
+    )
+    window.add_argument("--to", dest="end", type=datetime.date.fromisoformat, metavar="DATE", help="Last date")
+    window.add_argument("--weeks", type=int, metavar="N", help="Sync this many weeks from the first date")
+    parser.add_argument(
+        "--parser",
+        choices=["html", "selenium"],
+        default="html",
+        help="How to parse cached timetable pages, html does not need a browser",
+    )
+    parser.add_argument(
+        "--browser", action="store_true", help="Sign in to the timetable with a browser, instead of the saved session"
+    )
+    parser.add_argument("--parse-jobs", type=int, default=0, help="Parse cached timetable pages on N processes")
+    parser.add_argument("--profiles", type=Path, help="Sync every profile in a JSON file concurrently")
+    parser.add_argument(
+        "--concurrency", type=int, default=16, help="Maximum API requests in flight across all profiles"
+    )
+    parser.add_argument(
+        "--account-concurrency", type=int, default=4, help="Maximum API requests in flight for each profile"
+    )
+    api = parser.add_mutually_exclusive_group()
+    api.add_argument("--record", type=Path, help="Save all Google Calendar traffic to a file")
+    api.add_argument("--replay", type=Path, help="Replay Google Calendar traffic saved with --record")
+    parser.add_argument(
+        "--metrics", type=Path, help="Export the run's metrics to METRICS.json and METRICS.prom when it ends"
+    )
     parser.add_argument("-v", "--verbose", dest="log_level", action="count", default=0, help="Increase verbosity")
 
-    return parser.parse_args()
+    ns = parser.parse_args()
+    if ns.force and (ns.start or ns.end or ns.weeks is not None):
+        parser.error("--force cannot be used with --from, --to or --weeks")
+    if ns.weeks is not None and ns.weeks < 1:
+        parser.error("--weeks must be at least 1")
+    if ns.end is not None and ns.end < (ns.start or datetime.datetime.now(gregle.tz.DEFAULT).date()):
+        parser.error("--to cannot be before --from, which defaults to today")
+    if ns.batch and ns.workers:
+        parser.error("--batch cannot be used with -j")
+    if ns.profiles is not None and (ns.batch or ns.workers or ns.start or ns.end or ns.weeks is not None):
+        parser.error("--profiles cannot be used with --batch, -j, --from, --to or --weeks")
+    return ns
 
 
 def show_diff(change: gregle.event.Diff[gregle.Event]) -> None:
@@ -108,29 +243,219 @@ def show_diff(change: gregle.event.Diff[gregle.Event]) -> None:
             gregle.log.info("Updating %s --> %s", old.pretty(), new.pretty())
 
 
+def apply_changes(
+    api: gregle.gcal.service.API,
+    calendar: gregle.gcal.service.Calendar,
+    changes: Iterable[gregle.event.Diff[gregle.Event]],
+    *,
+    dry_run: bool,
+    batch: bool,
+    workers: int,
+    rate: float = gregle.gcal.executor.RATE_LIMIT,
+    quota: gregle.gcal.executor.Quota | None = None,
+) -> int:
+    """Apply the `changes` to the calendar.
+
+    Returns:
+        The number of changes that failed."""
+    failed = 0
+
+    def shown() -> Iterator[gregle.event.Diff[gregle.Event]]:
+        for change in changes:
+            show_diff(change)
+            yield change
+
+    def report(results: Iterable[gregle.gcal.cal.Mutation]) -> None:
+        nonlocal failed
+        for result in results:
+            metrics.count("gregle_changes_total", kind=result.change[0], outcome="ok" if result.ok else "failed")
+            if not result.ok:
+                failed += 1
+                gregle.log.error("Failed to %s %s", result.change[0], result.change[1], exc_info=result.error)
+
+    with metrics.stage("apply"):
+        if batch:
+            report(gregle.gcal.cal.process_batch(api, calendar, shown(), dry_run=dry_run))
+        elif workers > 0:
+            with gregle.gcal.executor.MutationExecutor(
+                api, calendar, dry_run=dry_run, workers=workers, rate=rate, quota=quota
+            ) as executor:
+                report(executor.map(shown()))
+        else:
+            for change in shown():
+                try:
+                    gregle.gcal.cal.process_diff(api, calendar, change, dry_run=dry_run)
+                except Exception:
+                    metrics.count("gregle_changes_total", kind=change[0], outcome="failed")
+                    raise
+                metrics.count("gregle_changes_total", kind=change[0], outcome="ok")
+    return failed
+
+
+def sync_profiles(ns: argparse.Namespace) -> None:
+    profiles = gregle.sync.load_profiles(ns.profiles)
+    service = gregle.sync.SyncService(
+        dry_run=ns.dry_run, concurrency=ns.concurrency, per_account=ns.account_concurrency
+    )
+    reports = asyncio.run(service.run(profiles))
+    for report in reports:
+        (gregle.log.info if report.ok else gregle.log.error)("%s", report.summary())
+    gregle.log.info("Synced %d/%d profiles", sum(r.ok for r in reports), len(reports))
+
+
+def connect(ns: argparse.Namespace) -> gregle.gcal.service.API:
+    if ns.replay is not None:
+        return gregle.gcal.fake.replay(ns.replay)
+    api = gregle.gcal.service.calendar()
+    if ns.record is not None:
+        return gregle.gcal.fake.record(api, ns.record)
+    return api
+
+
+def sync_calendar(
+    api: gregle.gcal.service.API,
+    name: str,
+    local: list[gregle.lu.Events],
+    date_range: tuple[datetime.date, datetime.date],
+    *,
+    force: bool,
+    incremental: bool,
+    dry_run: bool,
+    batch: bool,
+    workers: int,
+    cache_dir: Path | None = None,
+    rate: float = gregle.gcal.executor.RATE_LIMIT,
+    quota: gregle.gcal.executor.Quota | None = None,
+    window: tuple[datetime.date, datetime.date] | None = None,
+    state: gregle.sync.SyncState | None = None,
+) -> int:
+    """Sync the `local` events into the calendar called `name`.
+
+    Args:
+        state: Record the calendar, its sync token and the `window` in this state if every change was applied,
+            requires `incremental`.
+
+    Returns:
+        The number of changes that failed."""
+    if window is not None:
+        if force:
+            raise ValueError("A forced sync recreates every event, it cannot be limited to a window")
+        local = [clipped for event in local if (clipped := event.clip(*window)) is not None]
+        date_range = window
+        gregle.log.info("Syncing %d LU events from %s to %s", len(local), *window)
+    calendar = gregle.gcal.cal.get_calendar(api, name)
+    remote = events_remote(api, calendar, date_range, incremental, cache_dir)
+    apply = functools.partial(
+        apply_changes, api, calendar, dry_run=dry_run, batch=batch, workers=workers, rate=rate, quota=quota
+    )
+    if force:
+        failed = apply(
+            [*(("delete", event) for event in remote if event.id()), *(("create", event) for event in local)]
+        )
+    else:
+        # Updates are applied while the remote events are still arriving, the rest once they have all been seen
+        deferred: list[gregle.event.Diff[gregle.Event]] = []
+        failed = apply(stream_changes(remote, local, deferred, window))
+        failed += apply(deferred)
+
+    if state is not None and incremental and not failed:
+        # Fetch the changes just made, so the next sync can tell whether anything else has changed the calendar
+        filepath = gregle.gcal.mirror.filepath(calendar, cache_dir)
+        mirror = gregle.gcal.mirror.sync(api, gregle.gcal.mirror.Mirror.load(filepath, calendar))
+        mirror.save(filepath)
+        state.calendar, state.sync_token, state.window = calendar, mirror.sync_token, window
+    return failed
+
+
+def up_to_date(
+    api: gregle.gcal.service.API,
+    state: gregle.sync.SyncState,
+    window: tuple[datetime.date, datetime.date] | None,
+    cache_dir: Path | None = None,
+) -> bool:
+    """Whether the calendar has not changed since the last successful sync recorded in `state`, which covered `window`.
+
+    Costs a single request, which also brings the calendar's mirror up to date.
+    If the calendar has not changed, the `state` is moved to the mirror's new sync token, so it can be checked again."""
+    if state.calendar is None or state.sync_token is None or not state.covers(window):
+        return False
+    filepath = gregle.gcal.mirror.filepath(state.calendar, cache_dir)
+    mirror = gregle.gcal.mirror.Mirror.load(filepath, state.calendar)
+    if mirror.sync_token != state.sync_token:
+        return False
+    changed = gregle.gcal.mirror.update(api, mirror)
+    mirror.save(filepath)
+    if changed != 0:
+        return False
+    state.sync_token = mirror.sync_token
+    return True
+
+
 def main() -> None:
     ns = cli()
     log_config(ns.log_level)
     try:
-        local, date_range = events_local(ns.cache)
-        with gregle.gcal.service.calendar() as api:
-            calendar = gregle.gcal.cal.get_calendar(api, "Timetable")
-            remote = events_remote(api, calendar, date_range)
-            if ns.force:
-                for event in remote:
-                    if eid := event.id():
-                        show_diff(("delete", event))
-                        gregle.gcal.cal.post_delete(api, calendar, eid, dry_run=ns.dry_run)
-                for event in local:
-                    show_diff(("create", event))
-                    gregle.gcal.cal.post_create(api, calendar, gregle.gcal.Event.from_event(event), dry_run=ns.dry_run)
-            else:
-                for change in gregle.lu.diff(list(gcal_to_lu(api, calendar, remote, ns.dry_run)), local):
-                    show_diff(change)
-                    gregle.gcal.cal.process_diff(api, calendar, change, dry_run=ns.dry_run)
+        if ns.profiles is not None:
+            sync_profiles(ns)
+            return
+        # A forced sync, or one without the cache, always runs in full
+        record = ns.cache and not ns.force and not ns.dry_run
+        state_file = gregle.path.CACHE / "state.json"
+        state = gregle.sync.SyncState.load(state_file) if record else gregle.sync.SyncState()
+        semester = gregle.path.CACHE / "semester"
+        encoding = gregle.sync.encoding()
+        pages = None
+        browser = ns.browser
+        if record:
+            # Fetch stale pages now, so they can be compared with the last sync before anything is parsed
+            if gregle.lu.ri.cached_stale(semester) and not browser:
+                with metrics.stage("scrape"):
+                    # The saved session has just failed, so do not try it again before signing in
+                    browser = not gregle.lu.ri.fetch_pages(semester)
+            if not gregle.lu.ri.cached_stale(semester):
+                pages = gregle.lu.ri.page_digests(semester)
+        with connect(ns) as api:
+            if (
+                pages
+                and pages == state.pages
+                and encoding == state.encoding
+                and state.span
+                and up_to_date(api, state, sync_window(ns, state.span))
+            ):
+                gregle.log.info("Up to date: the timetable and calendar have not changed since the last sync")
+                state.save(state_file)
+                return
+            local, date_range = events_local(ns.cache, ns.parser, ns.parse_jobs, browser)
+            window = sync_window(ns, date_range)
+            digest = gregle.lu.ri.events_digest(local)
+            if record and digest == state.events and encoding == state.encoding and up_to_date(api, state, window):
+                gregle.log.info("Up to date: the timetable events and calendar have not changed since the last sync")
+                state.pages = gregle.lu.ri.page_digests(semester)
+                state.save(state_file)
+                return
+            failed = sync_calendar(
+                api,
+                "Timetable",
+                local,
+                date_range,
+                force=ns.force,
+                incremental=ns.cache,
+                dry_run=ns.dry_run,
+                batch=ns.batch,
+                workers=ns.workers,
+                window=window,
+                state=state if record else None,
+            )
+        if record and not failed:
+            state.pages, state.events, state.span = gregle.lu.ri.page_digests(semester), digest, date_range
+            state.encoding = encoding
+            state.save(state_file)
     except Exception as e:
         gregle.log.fatal("Unhandled exception", exc_info=e)
         raise
+    finally:
+        if ns.metrics is not None:
+            metrics.export(ns.metrics)
 
 
 if __name__ == "__main__":
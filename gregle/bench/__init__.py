@@ -0,0 +1,4 @@
+from . import generate, suite
+from .suite import BENCHMARKS, Result, run
+
+__all__ = ["BENCHMARKS", "Result", "generate", "run", "suite"]
@@ -0,0 +1,49 @@
+import argparse
+import json
+import logging
+import platform
+import sys
+from pathlib import Path
+
+from gregle.bench import suite
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser("gregle.bench", description="Time gregle's hot paths on synthetic inputs")
+    parser.add_argument("patterns", nargs="*", default=["*"], help="Only run the benchmarks matching these patterns")
+    parser.add_argument("--scale", type=int, default=1, help="Multiplier of the size of the inputs")
+    parser.add_argument("--runs", type=int, default=5, help="Number of timed runs of each benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated inputs")
+    parser.add_argument("-o", "--output", type=Path, help="Write the results to a file instead of stdout")
+    parser.add_argument("-l", "--list", action="store_true", help="List the benchmarks and exit")
+    ns = parser.parse_args()
+
+    if ns.list:
+        print("\n".join(suite.BENCHMARKS))
+        return
+
+    logging.getLogger("gregle").setLevel(logging.WARNING)
+    results = suite.run(ns.patterns, scale=ns.scale, runs=ns.runs, seed=ns.seed)
+    for result in results:
+        print(
+            f"{result.name:<36} {result.best * 1000:>10.2f}ms {result.throughput:>14,.0f}/s {result.peak_bytes / 2**20:>8.2f}MiB",
+            file=sys.stderr,
+        )
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": ns.scale,
+        "runs": ns.runs,
+        "seed": ns.seed,
+        "results": [result.as_dict() for result in results],
+    }
+    output = json.dumps(report, indent=2)
+    if ns.output is None:
+        print(output)
+    else:
+        ns.output.write_text(output)
+
+
+if __name__ == "__main__":
+    main()
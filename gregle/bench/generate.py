@@ -0,0 +1,139 @@
+import datetime
+import html
+import random
+from collections.abc import Iterator
+from typing import Any
+
+from .. import tz
+from ..gcal.event import EventView
+from ..lu.dates import DateSet
+from ..lu.event import EventInstance, EventSchedule
+
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri")
+COLUMNS = 20
+"""Half hour columns of a timetable row, from 09:00 to 19:00."""
+ROOMS = ("SMB0.01", "SMB1.14", "N001", "N.0.03", "T.1.04", "EHB.0.12", "CC.0.11", "WPT.0.20", "U.1.03", "RT.0.19")
+CONTENT_TYPES = ("Lecture", "Tutorial", "Lab", "Seminar", "Practical")
+TERM_START = datetime.date(2024, 9, 30)
+
+
+def week_names(weeks: int, semester: int = 1, start: datetime.date = TERM_START) -> list[str]:
+    """The options of the timetable's week selector dropdown."""
+    return [f"Semester {semester}"] + [
+        f"Sem {semester} - Wk {wk} (starting {(start + datetime.timedelta(weeks=wk - 1)):%d-%b-%Y})"
+        for wk in range(1, weeks + 1)
+    ]
+
+
+def weeks_text(rng: random.Random, weeks: int, semester: int = 1) -> str:
+    """The contents of a `tt_weeks_row`, a mix of single weeks and ranges."""
+    parts: list[str] = []
+    wk = rng.randint(1, 3)
+    while wk <= weeks:
+        end = min(weeks, wk + rng.choice((0, 0, 1, 3, 5, 9)))
+        parts.append(str(wk) if end == wk else f"{wk}-{end}")
+        wk = end + rng.randint(2, 3)
+    return f"Weeks: Sem {semester}: {', '.join(parts) or '1'}"
+
+
+def modules(rng: random.Random, count: int) -> list[tuple[str, str]]:
+    """Module codes and names."""
+    return [
+        (f"{rng.randint(20, 24)}{rng.choice('ABCDEF')}{i:03}", f"Module {i} {rng.choice('XYZ')}") for i in range(count)
+    ]
+
+
+def info_cell(rng: random.Random, module: tuple[str, str], colspan: int, weeks: int) -> str:
+    code, name = module
+    lecturers = ", ".join(f"Dr {rng.choice('ABCDEFGH')}{rng.randint(0, 40)}" for _ in range(rng.randint(1, 3)))
+    rooms = ", ".join(rng.sample(ROOMS, rng.randint(1, 2)))
+    rows = {
+        "tt_module_id_row": code,
+        "tt_module_name_row": name,
+        "tt_lect_row": lecturers,
+        "tt_room_row": rooms,
+        "tt_modtype_row": rng.choice(CONTENT_TYPES),
+        "tt_weeks_row": weeks_text(rng, weeks),
+    }
+    content = "".join(f'<div class="{cls}">{html.escape(text)}</div>' for cls, text in rows.items())
+    return f'<td class="tt_info_cell" colspan="{colspan}">{content}</td>'
+
+
+def timetable_row(rng: random.Random, mods: list[tuple[str, str]], weeks: int, density: float) -> str:
+    cells: list[str] = []
+    column = 0
+    while column < COLUMNS:
+        colspan = rng.choice((2, 2, 4))
+        if column + colspan <= COLUMNS and rng.random() < density:
+            cells.append(info_cell(rng, rng.choice(mods), colspan, weeks))
+            column += colspan
+        else:
+            cells.append("<td></td>")
+            column += 1
+    return "".join(cells)
+
+
+def timetable_html(
+    rng: random.Random, *, weeks: int = 12, rows: int = 3, modules_count: int = 40, density: float = 0.5
+) -> str:
+    """The HTML source of a timetable page in the layout of the LU timetable.
+
+    Args:
+        rng: Source of randomness, seed it for repeatable pages.
+        weeks: Number of weeks in the semester.
+        rows: Number of rows for each weekday.
+        modules_count: Number of distinct modules.
+        density: Chance of each free slot starting an event."""
+    mods = modules(rng, modules_count)
+    options = "".join(f"<option>{html.escape(name)}</option>" for name in week_names(weeks))
+    body: list[str] = []
+    for day in WEEKDAYS:
+        for row in range(rows):
+            head = f'<td class="weekday_col" rowspan="{rows}">{day}</td>' if row == 0 else ""
+            body.append(f'<tr class="tt_info_row">{head}{timetable_row(rng, mods, weeks, density)}</tr>')
+    body.append('<tr class="tt_info_row"><td class="weekday_col" rowspan="1">On Demand</td><td></td></tr>')
+    return (
+        f'<html><body><select id="P2_MY_PERIOD">{options}</select>'
+        f'<table id="timetable_details"><tbody>{"".join(body)}</tbody></table></body></html>'
+    )
+
+
+def schedules(rng: random.Random, count: int, *, weeks: int = 12, modules_count: int = 40) -> Iterator[EventSchedule]:
+    """Timetable events, as if they had been parsed from a timetable page."""
+    mods = modules(rng, modules_count)
+    for _ in range(count):
+        code, name = rng.choice(mods)
+        instance = EventInstance(
+            (code,),
+            name,
+            tuple(sorted(rng.sample(ROOMS, rng.randint(1, 2)))),
+            (f"Dr {rng.choice('ABCDEFGH')}",),
+            rng.choice(CONTENT_TYPES),
+            datetime.time(rng.randint(9, 17)),
+            datetime.timedelta(hours=rng.choice((1, 2))),
+        )
+        weekday = rng.randrange(len(WEEKDAYS))
+        dates = DateSet(
+            TERM_START + datetime.timedelta(weeks=wk, days=weekday)
+            for wk in rng.sample(range(weeks), rng.randint(1, weeks))
+        )
+        yield EventSchedule(None, instance, dates)
+
+
+def calendar_events(rng: random.Random, count: int, **kwargs: Any) -> list[dict[str, Any]]:
+    """Calendar API event resources, in the form they are returned by `events.list`.
+
+    Args:
+        rng: Source of randomness, seed it for repeatable events.
+        count: Number of events.
+        kwargs: Passed to `schedules`."""
+    items: list[dict[str, Any]] = []
+    for i, event in enumerate(schedules(rng, count, **kwargs)):
+        raw = EventView.from_event(event).raw
+        raw["id"] = f"bench{i:08x}"
+        raw["status"] = "confirmed"
+        for key in ("start", "end"):
+            local = datetime.datetime.fromisoformat(raw[key]["dateTime"]).replace(tzinfo=tz.DEFAULT)
+            raw[key]["dateTime"] = local.isoformat()
+        items.append(raw)
+    return items
@@ -0,0 +1,168 @@
+import argparse
+import itertools
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Literal
+
+from gregle.__main__ import sync_calendar
+from gregle.event import datespan
+from gregle.gcal.event import EventView
+from gregle.gcal.executor import RATE_LIMIT, Quota
+from gregle.gcal.fake import FakeCalendarServer
+from gregle.lu.event import EventSchedule
+from gregle.lu.ri import dedupe_events
+from gregle.metrics import metrics
+
+from . import generate
+
+type Mode = Literal["sequential", "batch", "workers"]
+MODES: tuple[Mode, ...] = ("sequential", "batch", "workers")
+
+
+@dataclass
+class Scenario:
+    """A sync of a calendar that differs from the timetable by `diff` of its events.
+
+    Attributes:
+        events: Number of timetable events, before they are deduplicated.
+        diff: Fraction of the events missing from, changed on or extra to the calendar.
+        mode: How the changes are applied.
+        workers: Threads used by the workers mode.
+        rate: Requests per second of the workers mode.
+        incremental: Fetch the calendar with sync tokens instead of listing it."""
+
+    events: int
+    diff: float
+    mode: Mode
+    workers: int = 8
+    rate: float = RATE_LIMIT
+    incremental: bool = True
+
+
+def seed(server: FakeCalendarServer, rng: random.Random, scenario: Scenario) -> tuple[str, list[EventSchedule]]:
+    """Create the timetable and the calendar of the scenario."""
+    calendar = server.add_calendar("Timetable")
+    local = dedupe_events(generate.schedules(rng, scenario.events))
+    third = scenario.diff / 3
+    for event in local:
+        roll = rng.random()
+        if roll < third:
+            continue
+        if roll < 2 * third and len(event.on_dates) > 1:
+            event = EventSchedule(None, event.instance, event.on_dates[1:])
+        server.put(calendar, EventView.from_event(event).raw)
+    for event in generate.schedules(rng, round(len(local) * third), modules_count=5):
+        server.put(calendar, EventView.from_event(event).raw)
+    return calendar, local
+
+
+def converged(server: FakeCalendarServer, calendar: str, local: list[EventSchedule]) -> bool:
+    """Whether the calendar has every event of the timetable on the same dates, and no others."""
+    remote = dedupe_events(EventSchedule.from_event(EventView(raw)) for raw in server.events(calendar))
+    return {e.group(): e.on_dates for e in remote} == {e.group(): e.on_dates for e in local}
+
+
+def run(scenario: Scenario, *, seed_value: int = 0, **server: Any) -> dict[str, Any]:
+    """Sync a scenario against a fake Calendar API.
+
+    Args:
+        scenario: The scenario to run.
+        seed_value: Seed of the generated timetable and calendar.
+        server: Passed to `FakeCalendarServer`.
+
+    Returns:
+        The scenario, its wall time and stage times, the traffic it caused, any error that stopped it and whether the calendar converged."""
+    rng = random.Random(f"{seed_value}:{scenario.events}:{scenario.diff}")
+    fake = FakeCalendarServer(seed=seed_value, **server)
+    calendar, local = seed(fake, rng, scenario)
+    remote = len(fake.events(calendar))
+    fake.reset_traffic()
+    metrics.clear()
+
+    with tempfile.TemporaryDirectory(prefix="gregle-load-") as cache_dir, fake.api() as api:
+        start = time.perf_counter()
+        error: Exception | None = None
+        try:
+            sync_calendar(
+                api,
+                "Timetable",
+                local,
+                datespan(local),
+                force=False,
+                incremental=scenario.incremental,
+                dry_run=False,
+                batch=scenario.mode == "batch",
+                workers=scenario.workers if scenario.mode == "workers" else 0,
+                cache_dir=Path(cache_dir),
+                rate=scenario.rate,
+                quota=Quota(Path(cache_dir) / "quota.json"),
+            )
+        except Exception as exc:
+            error = exc
+        wall = time.perf_counter() - start
+
+    stages = metrics.timings.get("gregle_stage_seconds", {})
+    return {
+        **asdict(scenario),
+        "local": len(local),
+        "remote": remote,
+        "wall": wall,
+        **fake.traffic.as_dict(),
+        "stages": {dict(labels)["stage"]: seconds for labels, (seconds, _) in stages.items()},
+        "error": None if error is None else repr(error),
+        "converged": converged(fake, calendar, local),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser("gregle.bench.load", description="Drive full syncs against a fake Calendar API")
+    parser.add_argument("--events", type=int, nargs="+", default=[200, 2000], help="Sizes of the timetable")
+    parser.add_argument("--diff", type=float, nargs="+", default=[0.0, 0.1, 0.5], help="Fractions of events to change")
+    parser.add_argument("--mode", choices=MODES, nargs="+", default=list(MODES), help="How to apply the changes")
+    parser.add_argument("-j", "--workers", type=int, default=8, help="Threads of the workers mode")
+    parser.add_argument("--rate", type=float, default=RATE_LIMIT, help="Requests per second of the workers mode")
+    parser.add_argument("--full", dest="incremental", action="store_false", help="List the calendar every sync")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds each round trip takes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maximum random seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Chance of a call being rate limited")
+    parser.add_argument("--qps", type=float, help="Calls per second before calls are rate limited")
+    parser.add_argument("--page-size", type=int, default=2500, help="Largest page of list calls")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated timetables and calendars")
+    parser.add_argument("-o", "--output", type=Path, help="Write the results to a file instead of stdout")
+    ns = parser.parse_args()
+
+    logging.getLogger("gregle").setLevel(logging.CRITICAL)
+    results: list[dict[str, Any]] = []
+    for events, diff, mode in itertools.product(ns.events, ns.diff, ns.mode):
+        result = run(
+            Scenario(events, diff, mode, ns.workers, ns.rate, ns.incremental),
+            seed_value=ns.seed,
+            latency=ns.latency,
+            jitter=ns.jitter,
+            error_rate=ns.error_rate,
+            qps=ns.qps,
+            page_size=ns.page_size,
+        )
+        results.append(result)
+        print(
+            f"{events:>7} {diff:>5.2f} {mode:<10} {result['wall']:>8.3f}s {sum(result['requests'].values()):>6} calls"
+            f" {result['round_trips']:>6} trips {result['bytes_sent'] + result['bytes_received']:>10} bytes"
+            f"{'' if result['converged'] else ' NOT CONVERGED'}",
+            file=sys.stderr,
+        )
+
+    output = json.dumps({"seed": ns.seed, "results": results}, indent=2)
+    if ns.output is None:
+        print(output)
+    else:
+        ns.output.write_text(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import datetime
+import fnmatch
+import gc
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+import weakref
+from collections.abc import Callable, Iterable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from .. import cache, tz
+from ..event import datespan
+from ..gcal.event import EventView
+from ..lu import page, ri
+from ..lu.address import directory as room_directory
+from ..lu.diff import changes
+from ..lu.index import EventIndex
+from ..lu.timetable import DataNode, event_from_node, extract_repeated_weeks, week_map
+from . import generate
+
+type Setup = Callable[[random.Random, int], tuple[Callable[[], Any], int]]
+"""Prepare the inputs of a benchmark at a scale, returning the function to time and the number of items it processes."""
+
+BENCHMARKS: dict[str, Setup] = {}
+
+
+def benchmark(name: str) -> Callable[[Setup], Setup]:
+    def benchmark_decorator(setup: Setup) -> Setup:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return benchmark_decorator
+
+
+@dataclass
+class Result:
+    """The measurements of a single benchmark.
+
+    Attributes:
+        name: The benchmark.
+        scale: The scale the inputs were generated at.
+        items: The number of items processed by each run.
+        runs: The number of timed runs.
+        best: The fastest run in seconds.
+        mean: The mean run in seconds.
+        throughput: Items per second of the fastest run.
+        peak_bytes: Peak memory allocated during a run."""
+
+    name: str
+    scale: int
+    items: int
+    runs: int
+    best: float
+    mean: float
+    throughput: float
+    peak_bytes: int
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def measure(name: str, func: Callable[[], Any], items: int, *, scale: int, runs: int) -> Result:
+    """Time `func` over `runs` runs, then measure its peak memory in a separate untimed run."""
+    times: list[float] = []
+    for _ in range(runs):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(times)
+    return Result(name, scale, items, runs, best, statistics.fmean(times), items / best if best else 0.0, peak)
+
+
+def run(patterns: Iterable[str] = ("*",), *, scale: int = 1, runs: int = 5, seed: int = 0) -> list[Result]:
+    """Run the benchmarks whose names match any of `patterns`.
+
+    Args:
+        patterns: Shell style patterns of the benchmark names.
+        scale: Multiplier of the size of the generated inputs.
+        runs: Number of timed runs of each benchmark.
+        seed: Seed of the generated inputs, the same seed produces the same inputs."""
+    patterns = list(patterns)
+    results: list[Result] = []
+    for name, setup in BENCHMARKS.items():
+        if not any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns):
+            continue
+        func, items = setup(random.Random(f"{seed}:{name}"), scale)
+        results.append(measure(name, func, items, scale=scale, runs=runs))
+    return results
+
+
+@benchmark("timetable.extract_repeated_weeks")
+def _extract_repeated_weeks(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    texts = [generate.weeks_text(rng, 12).lower() for _ in range(2000 * scale)]
+    weeks = week_map(generate.week_names(12))
+    return lambda: [extract_repeated_weeks(text, weeks) for text in texts], len(texts)
+
+
+@benchmark("timetable.event_from_node")
+def _event_from_node(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    document = page.parse(generate.timetable_html(rng, rows=4 * scale))
+    selector = document.by_id("P2_MY_PERIOD")
+    assert selector is not None
+    weeks = week_map(option.text() for option in selector.iter() if option.tag == "option")
+    cells = [
+        DataNode(
+            {
+                "attrs": {"colspan": cell.attribute("colspan")},
+                "find": {child.classes[0]: {"text": child.text()} for child in cell.elements()},
+            }
+        )
+        for cell in document.find_all("tt_info_cell")
+    ]
+    start = datetime.datetime(2000, 1, 3, 9, tzinfo=tz.DEFAULT)
+    return lambda: [event_from_node(cell, start, weeks) for cell in cells], len(cells)
+
+
+@benchmark("page.events_from_source")
+def _events_from_source(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    src = generate.timetable_html(rng, rows=4 * scale)
+    return lambda: page.events_from_source(src, 1), len(src)
+
+
+@benchmark("ri.dedupe_events")
+def _dedupe_events(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    events = list(generate.schedules(rng, 5000 * scale, modules_count=20))
+    return lambda: ri.dedupe_events(events), len(events)
+
+
+@benchmark("diff.changes")
+def _changes(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    local = ri.dedupe_events(generate.schedules(rng, 2000 * scale))
+    remote = [e for e in local if rng.random() < 0.9]
+    for i in rng.sample(range(len(remote)), len(remote) // 10):
+        remote[i] = type(remote[i])(f"id{i}", remote[i].instance, remote[i].on_dates[1:] or remote[i].on_dates)
+    return lambda: list(changes(remote, local)), len(local) + len(remote)
+
+
+@benchmark("index.build")
+def _index_build(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    events = list(generate.schedules(rng, 2000 * scale))
+    return lambda: EventIndex(events), len(events)
+
+
+@benchmark("index.queries")
+def _index_queries(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    index = EventIndex(generate.schedules(rng, 2000 * scale))
+    times = [
+        datetime.datetime.combine(generate.TERM_START, datetime.time(rng.randrange(9, 18)), tz.DEFAULT)
+        + datetime.timedelta(days=rng.randrange(84))
+        for _ in range(200)
+    ]
+
+    def queries() -> None:
+        for when in times:
+            index.between(when, when + datetime.timedelta(hours=2))
+            index.at(when, room=generate.ROOMS[0])
+        for _ in index.clashes(room=generate.ROOMS[0]):
+            pass
+
+    return queries, len(times)
+
+
+@benchmark("address.resolve")
+def _resolve(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    codes = [*generate.ROOMS, "ZZ.0.01", "QA.1.02"]
+    rooms = [tuple(rng.sample(codes, rng.randint(1, 3))) for _ in range(5000 * scale)]
+    return lambda: [room_directory().resolve(room) for room in rooms], len(rooms)
+
+
+@benchmark("event_view.decode")
+def _decode(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    items = generate.calendar_events(rng, 2000 * scale)
+
+    def decode() -> None:
+        for raw in items:
+            view = EventView(raw)
+            view.time_start()
+            view.time_end()
+            view.occurrences()
+
+    return decode, len(items)
+
+
+@benchmark("event_view.encode")
+def _encode(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    events = list(generate.schedules(rng, 2000 * scale))
+    return lambda: [EventView.from_event(event) for event in events], len(events)
+
+
+@benchmark("event.datespan")
+def _datespan(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    events = list(generate.schedules(rng, 5000 * scale))
+    return lambda: datespan(events), len(events)
+
+
+def _func_cache(rng: random.Random, scale: int, *, read: bool) -> tuple[Callable[[], Any], int]:
+    events = list(generate.schedules(rng, 2000 * scale))
+    directory = Path(tempfile.mkdtemp(prefix="gregle-bench-"))
+    funccache = cache.FuncCache(lambda: events, directory / "events.pkl", datetime.timedelta(days=1), memory=False)
+    weakref.finalize(funccache, shutil.rmtree, directory, ignore_errors=True)
+    funccache.write()
+    return (funccache.read if read else funccache.write), len(events)
+
+
+@benchmark("cache.write")
+def _cache_write(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    return _func_cache(rng, scale, read=False)
+
+
+@benchmark("cache.read")
+def _cache_read(rng: random.Random, scale: int) -> tuple[Callable[[], Any], int]:
+    return _func_cache(rng, scale, read=True)
@@ -1,48 +1,175 @@
+import contextlib
 import datetime
+import gzip
+import hashlib
+import inspect
+import lzma
+import os
 import pickle
-from collections.abc import Callable
+import tempfile
+from collections.abc import Callable, Hashable, Iterator
 from pathlib import Path
+from typing import IO, Literal
+
+from .metrics import metrics
+
+FORMAT = 1
+"""Version of the on-disk entry format, entries written with any other version are ignored."""
+
+type Compression = Literal["gzip", "lzma"] | None
 
 
 class FuncCache[**P, R]:
-    def __init__(self, func: Callable[P, R], filepath: Path, lifetime: datetime.timedelta) -> None:
+    """Cache the results of `func` in memory and on disk.
+
+    Each distinct set of arguments is stored in its own file next to `filepath`.
+    Entries expire after `lifetime`, are written atomically and are ignored if they are corrupt
+    or were written with a different `schema`.
+
+    Args:
+        func: The function to cache.
+        filepath: The base path of the cache files.
+        lifetime: How long an entry is fresh for.
+        key: Map the arguments to the value identifying an entry, defaults to all arguments.
+        schema: Version of the cached data, change it when the type of the result changes.
+        compression: Compress the files on disk.
+        memory: Also keep entries in memory."""
+
+    def __init__(
+        self,
+        func: Callable[P, R],
+        filepath: Path,
+        lifetime: datetime.timedelta,
+        *,
+        key: Callable[P, Hashable] | None = None,
+        schema: int | str = 0,
+        compression: Compression = None,
+        memory: bool = True,
+    ) -> None:
         self.func = func
         self.filepath = filepath
         self.lifetime = lifetime
+        self.schema = schema
+        self.compression: Compression = compression
+        self.memory = memory
+        self._key = key
+        self._signature = inspect.signature(func)
+        self._entries: dict[str, tuple[datetime.datetime, R]] = {}
+
+    def key(self, *args: P.args, **kwargs: P.kwargs) -> Hashable:
+        if self._key is not None:
+            return self._key(*args, **kwargs)
+        bound = self._signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return tuple(bound.arguments.items())
+
+    def _digest(self, *args: P.args, **kwargs: P.kwargs) -> str:
+        return hashlib.sha256(repr(self.key(*args, **kwargs)).encode()).hexdigest()[:16]
+
+    def path(self, *args: P.args, **kwargs: P.kwargs) -> Path:
+        """The file storing the entry for the arguments."""
+        return self._path(self._digest(*args, **kwargs))
+
+    def _path(self, digest: str) -> Path:
+        return self.filepath.with_name(f"{self.filepath.stem}.{digest}{self.filepath.suffix}")
 
-    def read(self) -> R:
-        if not stale(self.filepath, self.lifetime):
-            return self.read_stale()
-        raise FileNotFoundError(f"{self.filepath} is stale")
+    def read(self, *args: P.args, **kwargs: P.kwargs) -> R:
+        digest = self._digest(*args, **kwargs)
+        if (entry := self._entries.get(digest)) is not None and not expired(entry[0], self.lifetime):
+            return entry[1]
+        filepath = self._path(digest)
+        if not stale(filepath, self.lifetime):
+            return self._load(digest, filepath)
+        raise FileNotFoundError(f"{filepath} is stale")
 
-    def read_stale(self) -> R:
-        with self.filepath.open("rb") as f:
-            return pickle.load(f)
+    def read_stale(self, *args: P.args, **kwargs: P.kwargs) -> R:
+        digest = self._digest(*args, **kwargs)
+        if (entry := self._entries.get(digest)) is not None:
+            return entry[1]
+        return self._load(digest, self._path(digest))
+
+    def _load(self, digest: str, filepath: Path) -> R:
+        try:
+            with filepath.open("rb") as raw, _open(raw, "rb", self.compression) as f:
+                version, schema, r = pickle.load(f)
+        except FileNotFoundError:
+            raise
+        except Exception as exc:
+            raise FileNotFoundError(f"{filepath} is corrupt") from exc
+        if version != FORMAT or schema != self.schema:
+            raise FileNotFoundError(f"{filepath} was written with format {version} schema {schema}")
+        if self.memory:
+            self._entries[digest] = (datetime.datetime.fromtimestamp(filepath.stat().st_mtime), r)
+        return r
 
     def write(self, *args: P.args, **kwargs: P.kwargs) -> R:
         r = self.func(*args, **kwargs)
-        with self.filepath.open("wb") as f:
-            pickle.dump(r, f)
+        digest = self._digest(*args, **kwargs)
+        with atomic(self._path(digest)) as raw, _open(raw, "wb", self.compression) as f:
+            pickle.dump((FORMAT, self.schema, r), f, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.memory:
+            self._entries[digest] = (datetime.datetime.now(), r)
         return r
 
     def rw(self, *args: P.args, **kwargs: P.kwargs) -> R:
-        if stale(self.filepath, self.lifetime):
+        try:
+            r = self.read(*args, **kwargs)
+        except FileNotFoundError:
+            metrics.count("gregle_cache_misses_total", cache=self.filepath.stem)
             return self.write(*args, **kwargs)
-        return self.read_stale()
+        metrics.count("gregle_cache_hits_total", cache=self.filepath.stem)
+        return r
+
+    def clear(self) -> None:
+        """Forget the entries held in memory."""
+        self._entries.clear()
 
     def __call__(self, *args: P.args, **kwargs: P.kwargs) -> R:
         return self.rw(*args, **kwargs)
 
 
-def file[**P, R](filepath: Path, lifetime: datetime.timedelta) -> Callable[[Callable[P, R]], FuncCache[P, R]]:
+def file[**P, R](
+    filepath: Path,
+    lifetime: datetime.timedelta,
+    *,
+    key: Callable[P, Hashable] | None = None,
+    schema: int | str = 0,
+    compression: Compression = None,
+    memory: bool = True,
+) -> Callable[[Callable[P, R]], FuncCache[P, R]]:
     def file_decorator(func: Callable[P, R]) -> FuncCache[P, R]:
-        return FuncCache(func, filepath, lifetime)
+        return FuncCache(func, filepath, lifetime, key=key, schema=schema, compression=compression, memory=memory)
 
     return file_decorator
 
 
+@contextlib.contextmanager
+def atomic(filepath: Path) -> Iterator[IO[bytes]]:
+    """Open a temporary file that replaces `filepath` once it has been completely written."""
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=filepath.parent, prefix=f".{filepath.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.replace(tmp, filepath)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+
+
+def _open(raw: IO[bytes], mode: Literal["rb", "wb"], compression: Compression) -> IO[bytes]:
+    match compression:
+        case "gzip":
+            return gzip.GzipFile(fileobj=raw, mode=mode)  # type: ignore[return-value]
+        case "lzma":
+            return lzma.LZMAFile(raw, mode)  # type: ignore[return-value]
+    return contextlib.nullcontext(raw)  # type: ignore[return-value]
+
+
+def expired(timestamp: datetime.datetime, lifetime: datetime.timedelta) -> bool:
+    return (datetime.datetime.now() - timestamp) >= lifetime
+
+
 def stale(filepath: Path, lifetime: datetime.timedelta) -> bool:
-    return (
-        not filepath.exists()
-        or (datetime.datetime.now() - datetime.datetime.fromtimestamp(filepath.stat().st_mtime)) >= lifetime
-    )
+    return not filepath.exists() or expired(datetime.datetime.fromtimestamp(filepath.stat().st_mtime), lifetime)
@@ -4,7 +4,7 @@ import io
 import itertools
 from dataclasses import dataclass
 from pprint import pp
-from typing import Any, Iterable, Literal, Self
+from typing import Any, Hashable, Iterable, Literal, Self
 
 
 @dataclass
@@ -43,6 +43,8 @@ class E:
 
 
 class Event(abc.ABC):
+    __slots__ = ()
+
     @abc.abstractmethod
     def id(self) -> str | None:
         """Optional unique identifier for the event."""
@@ -86,6 +88,10 @@ class Event(abc.ABC):
         """Convert another event to this event type."""
         ...
 
+    def group(self) -> Hashable | None:
+        """Identifies the events that hold different dates of the same recurring event, if known."""
+        return None
+
     def pretty(self) -> str:
         """Return a pretty string representation of the event."""
         buf = io.StringIO()
@@ -1,4 +1,15 @@
-from . import cal, service
-from .event import EventView as Event
+from typing import TYPE_CHECKING
 
-__all__ = ["cal", "Event", "service"]
+from .. import lazy
+
+if TYPE_CHECKING:
+    from . import cal, event, executor, fake, ft, mirror, service
+    from .event import EventView as Event
+
+__getattr__, __dir__ = lazy.attach(
+    __name__,
+    ["cal", "event", "executor", "fake", "ft", "mirror", "service"],
+    {"Event": ("event", "EventView")},
+)
+
+__all__ = ["cal", "Event", "executor", "fake", "mirror", "service"]
@@ -1,19 +1,38 @@
 import datetime
-from collections.abc import Iterator
+import functools
+import itertools
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from typing import Any
+
+from googleapiclient.errors import HttpError
 
 from gregle.gcal import ft
 
 from ..event import Diff, Event
 from ..log import log
-from .event import EventView
+from ..metrics import metrics
+from . import service
+from .event import FIELDS, EventView
 from .service import API, Calendar
 
+BATCH_LIMIT = 50
+"""Maximum number of calls the Calendar API accepts in a single batch request."""
+CALENDARS_PAGE_SIZE = 250
+EVENTS_PAGE_SIZE = 2500
+CALENDARS_FIELDS = "items(id,summary),nextPageToken"
+EVENTS_FIELDS = f"items({','.join(FIELDS)}),nextPageToken,nextSyncToken"
+
 
 def get_calendar(api: API, name: str) -> Calendar:
     page_token: str | None = None
     while True:
         log.info(f"Request: Calendars - {name}")
-        res: dict = api.calendarList().list(pageToken=page_token).execute()
+        res: dict = (
+            api.calendarList()
+            .list(pageToken=page_token, maxResults=CALENDARS_PAGE_SIZE, fields=CALENDARS_FIELDS)
+            .execute()
+        )
         for cal in res["items"]:
             if cal["summary"].lower() == name.lower():
                 return cal["id"]
@@ -34,6 +53,8 @@ def get_events(api: API, calendar_id: Calendar, start: datetime.date, end: datet
                 timeMin=start.strftime(ft.RFC3339_DATETIME_UTC),
                 timeMax=end.strftime(ft.RFC3339_DATETIME_UTC),
                 pageToken=page_token,
+                maxResults=EVENTS_PAGE_SIZE,
+                fields=EVENTS_FIELDS,
             )
             .execute()
         )
@@ -43,10 +64,22 @@ def get_events(api: API, calendar_id: Calendar, start: datetime.date, end: datet
             break
 
 
+def request_create(api: API, calendar: Calendar, event: EventView) -> Any:
+    return api.events().insert(calendarId=calendar, body=event.raw, fields="id")
+
+
+def request_update(api: API, calendar: Calendar, event_id: str, event: EventView) -> Any:
+    return api.events().update(calendarId=calendar, eventId=event_id, body=event.raw, fields="id")
+
+
+def request_delete(api: API, calendar: Calendar, event_id: str) -> Any:
+    return api.events().delete(calendarId=calendar, eventId=event_id)
+
+
 def post_create(api: API, calendar: Calendar, event: EventView, *, dry_run: bool) -> str:
     if dry_run:
         return event.id() or "dry-run"
-    eid = api.events().insert(calendarId=calendar, body=event.raw).execute()["id"]
+    eid = request_create(api, calendar, event).execute()["id"]
     event.raw["id"] = eid
     return eid
 
@@ -57,13 +90,13 @@ def post_update(api: API, calendar: Calendar, event_from: Event, event_to: Event
     event_to.raw["id"] = eid
     if dry_run:
         return
-    api.events().update(calendarId=calendar, eventId=eid, body=event_to.raw).execute()
+    request_update(api, calendar, eid, event_to).execute()
 
 
 def post_delete(api: API, calendar: Calendar, event_id: str, *, dry_run: bool) -> None:
     if dry_run:
         return
-    api.events().delete(calendarId=calendar, eventId=event_id).execute()
+    request_delete(api, calendar, event_id).execute()
 
 
 def process_diff(api: API, calendar: Calendar, change: Diff[Event], *, dry_run: bool) -> None:
@@ -77,3 +110,81 @@ def process_diff(api: API, calendar: Calendar, change: Diff[Event], *, dry_run:
             post_delete(api, calendar, e_id, dry_run=dry_run)
         case ("update", (e_from, e_to)):
             post_update(api, calendar, e_from, EventView.from_event(e_to), dry_run=dry_run)
+
+
+@dataclass
+class Mutation:
+    """Outcome of a single `Diff` applied to the calendar."""
+
+    change: Diff[Event]
+    body: EventView | None = None
+    response: Any = None
+    error: Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def resolve(self, response: Any, error: Exception | None = None) -> None:
+        """Record the API response, writing the new ID back into created events."""
+        self.response = response
+        self.error = error
+        if error is None and self.change[0] == "create" and self.body is not None:
+            self.body.raw["id"] = response["id"]
+
+
+def prepare(api: API, calendar: Calendar, change: Diff[Event]) -> tuple[Mutation, Any] | None:
+    """Build the API request for a change without executing it.
+
+    Returns:
+        The pending `Mutation` and its request, or `None` if the change needs no request."""
+    match change:
+        case ("create", e):
+            body = EventView.from_event(e)
+            return Mutation(change, body), request_create(api, calendar, body)
+        case ("delete", e):
+            if (eid := e.id()) is None:
+                return None
+            return Mutation(change), request_delete(api, calendar, eid)
+        case ("update", (e_from, e_to)):
+            if (eid := e_from.id()) is None:
+                return None
+            body = EventView.from_event(e_to)
+            body.raw["id"] = eid
+            return Mutation(change, body), request_update(api, calendar, eid, body)
+    raise ValueError(change)
+
+
+def _batch_callback(
+    mutation: Mutation, request: Any, request_id: str, response: Any, exception: Exception | None
+) -> None:
+    if isinstance(exception, HttpError):
+        service.record_error(request, exception)
+    mutation.resolve(response, exception)
+
+
+def process_batch(
+    api: API, calendar: Calendar, changes: Iterable[Diff[Event]], *, dry_run: bool, size: int = BATCH_LIMIT
+) -> Iterator[Mutation]:
+    """Apply many changes using batched HTTP requests.
+
+    Changes are submitted in chunks of at most `size` calls per round trip.
+    Failures do not abort the batch, they are reported on the matching `Mutation`.
+
+    Returns:
+        An iterator of the results in the same order as `changes`, yielded once their chunk has completed."""
+    size = max(1, min(size, BATCH_LIMIT))
+    for chunk in itertools.batched(changes, size):
+        items = [item for change in chunk if (item := prepare(api, calendar, change)) is not None]
+        if not items:
+            continue
+        if not dry_run:
+            batch = api.new_batch_http_request()
+            for i, (mutation, request) in enumerate(items):
+                batch.add(request, callback=functools.partial(_batch_callback, mutation, request), request_id=str(i))
+                service.record_request(request)
+            log.info(f"Request: Batch - {len(items)} changes")
+            metrics.count("gregle_api_round_trips_total")
+            batch.execute()
+        for mutation, _ in items:
+            yield mutation
@@ -1,32 +1,83 @@
 import contextlib
 import datetime
-from collections.abc import Iterable
-from dataclasses import dataclass
+import hashlib
+import json
+from collections.abc import Hashable, Iterable
 from typing import Any, Self
-from zoneinfo import ZoneInfo
 
-from gregle import tz
 from gregle.gcal import ft
 
 from ..event import Event
 from ..log import log
 
+FIELDS = ("id", "status", "summary", "description", "location", "start", "end", "recurrence", "extendedProperties")
+"""The event resource fields read by `EventView`, no other fields are requested from the API."""
+
 
 def parse_time(time: dict[str, str]) -> datetime.datetime:
-    try:
-        try:
-            return datetime.datetime.strptime(time["dateTime"], ft.RFC3339_DATETIME)
-        except ValueError:
-            t = time["dateTime"][:-3] + time["dateTime"][-2:]
-            return datetime.datetime.strptime(t, ft.RFC3339_DATETIME)
-    except ValueError:
-        info = ZoneInfo(key) if (key := time.get("timeZone", None)) is not None else tz.DEFAULT
-        return datetime.datetime.strptime(time["dateTime"], ft.RFC3339_DATETIME_LOCAL).astimezone(info)
-
-
-@dataclass(frozen=True)
+    return ft.parse_rfc3339(time["dateTime"], time.get("timeZone"))
+
+
+PROPERTY_HASH = "gregleHash"
+"""Private extended property holding the `fingerprint` of the event when it was written."""
+PROPERTY_GROUP = "gregleGroup"
+"""Private extended property holding the digest of the `Event.group` the event was written from."""
+ENCODING = 1
+"""Version of how `EventView.from_event` encodes an event, change it when the encoded content changes."""
+
+
+def _digest(data: Any) -> str:
+    return hashlib.sha256(json.dumps(data, separators=(",", ":")).encode()).hexdigest()[:32]
+
+
+def fingerprint(raw: dict[str, Any]) -> str:
+    """A stable hash of the content of an event resource, ignoring its ID and properties.
+
+    Times are compared by their local wall time and timezone, so an event
+    fetched from the API has the same fingerprint as the resource it was created from."""
+
+    def when(time: dict[str, str]) -> list[str | None]:
+        return [time.get("dateTime", "")[: len("YYYY-MM-DDTHH:MM:SS")], time.get("timeZone")]
+
+    return _digest(
+        [
+            raw.get("summary", "").strip(),
+            raw.get("description", "").strip(),
+            raw.get("location", "").strip(),
+            when(raw.get("start", {})),
+            when(raw.get("end", {})),
+            raw.get("recurrence", []),
+        ]
+    )
+
+
+def group_digest(group: Hashable) -> str:
+    return _digest(repr(group))
+
+
 class EventView(Event):
-    raw: dict[str, Any]
+    """A view of a Calendar API event resource.
+
+    The start, end and occurrences are decoded once, when first used.
+    Only the `id` of `raw` may be changed after that."""
+
+    __slots__ = ("raw", "_start", "_end", "_occurrences")
+
+    def __init__(self, raw: dict[str, Any]) -> None:
+        self.raw = raw
+        self._start: datetime.datetime | None = None
+        self._end: datetime.datetime | None = None
+        self._occurrences: tuple[datetime.date, ...] | None = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(raw={self.raw!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, EventView):
+            return NotImplemented
+        return self.raw == other.raw
+
+    __hash__ = None  # type: ignore[assignment]
 
     def id(self) -> str | None:
         return self.raw["id"]
@@ -41,63 +92,125 @@ class EventView(Event):
         return self.raw["location"].strip()
 
     def time_start(self) -> datetime.datetime:
-        return parse_time(self.raw["start"])
+        if self._start is None:
+            self._start = parse_time(self.raw["start"])
+        return self._start
 
     def time_end(self) -> datetime.datetime:
-        return parse_time(self.raw["end"])
+        if self._end is None:
+            self._end = parse_time(self.raw["end"])
+        return self._end
 
     def time_delta(self) -> datetime.timedelta:
         return self.time_end() - self.time_start()
 
+    def properties(self) -> dict[str, str]:
+        """The private extended properties of the event."""
+        return self.raw.get("extendedProperties", {}).get("private", {})
+
+    def fingerprint(self) -> str:
+        return fingerprint(self.raw)
+
+    def pristine(self) -> bool:
+        """Whether the event still has the content it was written with by gregle."""
+        return self.properties().get(PROPERTY_HASH) == self.fingerprint()
+
     def occurrences(self) -> Iterable[datetime.date]:
-        dates = []
-        for rule in self.raw.get("recurrence", []):
-            ty, rule = rule.split(";")
-            match ty:
-                case "RDATE":
-                    segments = rule.split(":")
-                    dates.extend(
-                        datetime.datetime.strptime(d, ft.RFC5545_DATETIME_LOCAL).date() for d in segments[-1].split(",")
-                    )
-                case _:
-                    log.error("Recurrence Rule Type '%s' is not supported", ty)
-        dates.sort()
-        return dates
+        if self._occurrences is None:
+            self._occurrences = tuple(sorted(_parse_recurrence(self.raw.get("recurrence", []))))
+        return self._occurrences
 
     @classmethod
     def from_event(cls, other: "Event") -> Self:
-        tzinfo = other.time_start().tzinfo
+        time_start = other.time_start()
+        tzinfo = time_start.tzinfo
         if tzinfo is None:
             raise ValueError("Event must have a timezone")
         tz: str = tzinfo.key  # type: ignore
-        start = other.time_start().time()
-        occurrences = other.occurrences()
+        occurrences = list(other.occurrences())
 
-        obj = {
+        obj: dict[str, Any] = {
             "id": other.id(),
             "summary": other.title(),
             "description": other.description(),
             "start": {
-                "dateTime": other.time_start().strftime(ft.RFC3339_DATETIME_LOCAL),
+                "dateTime": ft.format_rfc3339_local(time_start),
                 "timeZone": tz,
             },
             "end": {
-                "dateTime": (other.time_start() + other.time_delta()).strftime(ft.RFC3339_DATETIME_LOCAL),
+                "dateTime": ft.format_rfc3339_local(time_start + other.time_delta()),
                 "timeZone": tz,
             },
-            "recurrence": [
-                f"RDATE;TZID={tz}:"
-                + ",".join(
-                    datetime.datetime.combine(d, start, ZoneInfo(tz)).strftime(ft.RFC5545_DATETIME_LOCAL)
-                    for d in occurrences
-                )
-            ]
+            "recurrence": [f"RDATE;TZID={tz}:" + ",".join(ft.format_rfc5545_local(occurrences, time_start.time()))]
             if occurrences
             else [],
         }
         with contextlib.suppress(KeyError):
             obj["location"] = other.address()
+        private = {PROPERTY_HASH: fingerprint(obj)}
+        if (group := other.group()) is not None:
+            private[PROPERTY_GROUP] = group_digest(group)
+        obj["extendedProperties"] = {"private": private}
         return cls(obj)
 
 
+def _parse_recurrence(rules: list[str]) -> Iterable[datetime.date]:
+    for rule in rules:
+        ty, rule = rule.split(";", 1)
+        match ty:
+            case "RDATE":
+                yield from map(ft.parse_rfc5545_date, rule.rsplit(":", 1)[-1].split(","))
+            case _:
+                log.error("Recurrence Rule Type '%s' is not supported", ty)
+
+
+class FingerprintIndex[E: Event]:
+    """Local events indexed by the `fingerprint` they are written with, to match remote events without decoding them."""
+
+    def __init__(self, local: Iterable[E]) -> None:
+        self.unmatched: dict[str, list[E]] = {}
+        for event in local:
+            self.unmatched.setdefault(EventView.from_event(event).fingerprint(), []).append(event)
+        self.groups = {
+            group_digest(g) for events in self.unmatched.values() for e in events if (g := e.group()) is not None
+        }
+
+    def pop(self, remote: EventView) -> E | None:
+        """Remove and return a local event with the same content as `remote`, `None` if there is none."""
+        if matches := self.unmatched.get(remote.fingerprint()):
+            return matches.pop()
+        return None
+
+    def stale(self, remote: EventView) -> bool:
+        """Whether `remote` is a pristine event from a group that no local event belongs to."""
+        group = remote.properties().get(PROPERTY_GROUP)
+        return group is not None and group not in self.groups and remote.pristine()
+
+    def rest(self) -> list[E]:
+        """The local events no remote event has matched."""
+        return [event for events in self.unmatched.values() for event in events]
+
+
+def match_fingerprints[E: Event](
+    remote: Iterable[EventView], local: Iterable[E]
+) -> tuple[list[EventView], list[EventView], list[E]]:
+    """Match remote events to local events by their content, without decoding the remote events.
+
+    A remote event with the same `fingerprint` as a local event is unchanged, both are dropped.
+    Pristine remote events from a group that no remaining local event belongs to are stale.
+
+    Returns:
+        The stale remote events, the remote events that must be decoded to diff, and the unmatched local events."""
+    index = FingerprintIndex(local)
+    candidates = [event for event in remote if index.pop(event) is None]
+
+    rest = index.rest()
+    index.groups = {group_digest(g) for event in rest if (g := event.group()) is not None}
+    stale: list[EventView] = []
+    decode: list[EventView] = []
+    for event in candidates:
+        (stale if index.stale(event) else decode).append(event)
+    return stale, decode, rest
+
+
 Event.register(EventView)
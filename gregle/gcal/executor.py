@@ -0,0 +1,256 @@
+import datetime
+import itertools
+import json
+import random
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Self
+
+from googleapiclient.errors import HttpError
+
+from .. import path as PATH
+from .. import tz
+from ..event import Diff, Event
+from ..log import log
+from ..metrics import metrics
+from . import service
+from .cal import Mutation, prepare
+from .service import API, Calendar
+
+RATE_LIMIT = 10.0
+"""Requests per second, the Calendar API allows 600 requests per minute per user."""
+DAILY_QUOTA = 1_000_000
+"""Requests per day allowed for the project."""
+
+TRANSIENT_STATUS = frozenset({429, 500, 502, 503, 504})
+TRANSIENT_REASONS = frozenset({"rateLimitExceeded", "userRateLimitExceeded", "backendError"})
+
+
+class QuotaExceeded(Exception):
+    """Making another request would exceed the daily quota."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter.
+
+    Args:
+        rate: Tokens added per second.
+        capacity: Maximum number of tokens that can be saved up for a burst. Defaults to `rate`."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> None:
+        """Block until `tokens` are available and consume them."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def quota_day() -> datetime.date:
+    return datetime.datetime.now(tz.PACIFIC).date()
+
+
+class Quota:
+    """Daily request usage, persisted to `filepath` between runs.
+
+    Args:
+        filepath: Where the usage is stored.
+        limit: The daily request quota.
+        reserve: Number of requests to leave unused for other clients."""
+
+    def __init__(self, filepath: Path, limit: int = DAILY_QUOTA, reserve: int = 0) -> None:
+        self.filepath = filepath
+        self.limit = limit
+        self.reserve = reserve
+        self.day = quota_day()
+        self.used = self._load()
+        self._lock = threading.Lock()
+
+    def _load(self) -> int:
+        try:
+            data = json.loads(self.filepath.read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+        return int(data.get("used", 0)) if data.get("day") == self.day.isoformat() else 0
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.limit - self.reserve - self.used)
+
+    def take(self) -> None:
+        """Record a request.
+
+        Raises:
+            QuotaExceeded: If the request would exceed the quota."""
+        with self._lock:
+            if (day := quota_day()) != self.day:
+                self.day, self.used = day, 0
+            if self.used >= self.limit - self.reserve:
+                raise QuotaExceeded(f"{self.used}/{self.limit} requests used on {self.day}")
+            self.used += 1
+
+    def save(self) -> None:
+        with self._lock:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.filepath.with_name(self.filepath.name + ".tmp")
+            tmp.write_text(json.dumps({"day": self.day.isoformat(), "used": self.used}))
+            tmp.replace(self.filepath)
+
+
+def transient(exc: Exception) -> bool:
+    """Whether a failed request is worth retrying."""
+    if isinstance(exc, HttpError):
+        if exc.status_code in TRANSIENT_STATUS:
+            return True
+        details = exc.error_details if isinstance(exc.error_details, list) else []
+        return exc.status_code == 403 and any(
+            isinstance(d, dict) and d.get("reason") in TRANSIENT_REASONS for d in details
+        )
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 32.0) -> float:
+    """Exponential backoff delay with full jitter."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def execute(
+    request: Any,
+    *,
+    http: Any = None,
+    limiter: TokenBucket | None = None,
+    quota: Quota | None = None,
+    retries: int = 5,
+) -> Any:
+    """Execute an API request, retrying transient failures with backoff.
+
+    Args:
+        request: The request to execute.
+        http: The transport to use, defaults to the one the request was built with.
+        limiter: Rate limit each attempt.
+        quota: Record each attempt against the daily quota.
+        retries: Maximum number of retries for a transient failure.
+
+    Raises:
+        QuotaExceeded: If the quota has been used up."""
+    for attempt in itertools.count():
+        if quota is not None:
+            quota.take()
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return request.execute(http=http)
+        except Exception as exc:
+            if attempt >= retries or not transient(exc):
+                raise
+            delay = backoff(attempt)
+            metrics.count("gregle_api_retries_total", method=getattr(request, "methodId", None) or "unknown")
+            log.warning("Request failed, retrying in %.2fs: %s", delay, exc)
+            time.sleep(delay)
+
+
+class MutationExecutor:
+    """Apply calendar changes concurrently on a bounded thread pool.
+
+    Requests are rate limited to the API quota and transient failures are retried with backoff.
+    Once the daily quota is reached, all remaining changes fail with `QuotaExceeded`.
+
+    Args:
+        api: The calendar service.
+        calendar: The calendar to modify.
+        dry_run: Do not make any requests.
+        workers: Maximum number of requests in flight.
+        rate: Maximum requests per second.
+        quota: Daily usage tracker, defaults to one stored in the cache.
+        retries: Maximum number of retries for a transient failure."""
+
+    def __init__(
+        self,
+        api: API,
+        calendar: Calendar,
+        *,
+        dry_run: bool,
+        workers: int = 8,
+        rate: float = RATE_LIMIT,
+        quota: Quota | None = None,
+        retries: int = 5,
+    ) -> None:
+        self.api = api
+        self.calendar = calendar
+        self.dry_run = dry_run
+        self.retries = retries
+        self.limiter = TokenBucket(rate)
+        self.quota = Quota(PATH.CACHE / "quota.json") if quota is None else quota
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gregle-gcal")
+        self.http = service.HttpPool(api, workers)
+        self._stopped = threading.Event()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        self.http.close()
+        if not self.dry_run:
+            self.quota.save()
+
+    @property
+    def stopped(self) -> bool:
+        """Whether the quota has been exhausted."""
+        return self._stopped.is_set()
+
+    def submit(self, change: Diff[Event]) -> Future[Mutation] | None:
+        """Queue a change to be applied.
+
+        Returns:
+            A future of the applied `Mutation`, or `None` if the change needs no request."""
+        if (prepared := prepare(self.api, self.calendar, change)) is None:
+            return None
+        return self._pool.submit(self._run, *prepared)
+
+    def map(self, changes: Iterable[Diff[Event]]) -> Iterator[Mutation]:
+        """Apply all `changes`, yielding the results in the same order."""
+        futures = [f for change in changes if (f := self.submit(change)) is not None]
+        for future in futures:
+            yield future.result()
+
+    def _run(self, mutation: Mutation, request: Any) -> Mutation:
+        if self.dry_run:
+            return mutation
+        if self.stopped:
+            mutation.resolve(None, QuotaExceeded("Daily quota exhausted"))
+            return mutation
+        try:
+            with self.http.acquire() as http:
+                response = execute(request, http=http, limiter=self.limiter, quota=self.quota, retries=self.retries)
+        except QuotaExceeded as exc:
+            if not self.stopped:
+                log.error("Stopping mutations: %s", exc)
+            self._stopped.set()
+            mutation.resolve(None, exc)
+        except Exception as exc:
+            mutation.resolve(None, exc)
+        else:
+            mutation.resolve(response)
+        return mutation
@@ -0,0 +1,439 @@
+import collections
+import datetime
+import email.message
+import email.parser
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import Counter
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import httplib2
+
+from ..log import log
+from . import service
+from .event import EventView
+from .service import API, Calendar
+
+ROOT = "/calendar/v3/"
+BATCH = "/batch/calendar/v3"
+MAX_PAGE_SIZE = 2500
+"""The largest page `events.list` returns, whatever `maxResults` is."""
+
+RE_EVENTS = re.compile(r"calendars/(?P<calendar>[^/]+)/events(?:/(?P<event>[^/]+))?")
+RE_CONTENT_ID = re.compile(r"Content-ID: <(?P<base>[^ >]*) \+ (?P<id>[^>]*)>", re.IGNORECASE)
+
+type Response = tuple[int, dict[str, Any] | None]
+
+
+class Reject(Exception):
+    """A request the fake server responds to with an error."""
+
+    def __init__(self, status: int, reason: str, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+
+    def response(self) -> Response:
+        error = {"domain": "global", "reason": self.reason, "message": str(self)}
+        return self.status, {"error": {"code": self.status, "message": str(self), "errors": [error]}}
+
+
+@dataclass
+class Traffic:
+    """Requests served by a `FakeCalendarServer`.
+
+    Attributes:
+        requests: Number of calls by API method, calls in a batch are counted individually.
+        errors: Number of error responses by reason.
+        round_trips: Number of HTTP requests, a batch is a single round trip.
+        bytes_sent: Bytes of request bodies received by the server.
+        bytes_received: Bytes of response bodies sent by the server."""
+
+    requests: Counter[str] = field(default_factory=Counter)
+    errors: Counter[str] = field(default_factory=Counter)
+    round_trips: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "round_trips": self.round_trips,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+
+@dataclass
+class FakeCalendar:
+    summary: str
+    events: dict[str, tuple[int, dict[str, Any]]] = field(default_factory=dict)
+    """The events by their ID, with the sequence number of their last change. Deleted events are kept cancelled."""
+
+
+class FakeCalendarServer:
+    """An in-memory stand in for the Calendar API.
+
+    Implements the `calendarList.list` and `events.list/insert/update/delete` calls made by gregle,
+    including paging, sync tokens, partial responses and batches.
+    It is thread-safe, every transport from `http` shares the same calendars.
+
+    Args:
+        latency: Seconds each round trip takes.
+        jitter: Maximum random seconds added to the latency.
+        error_rate: Chance of a call failing with `rateLimitExceeded`.
+        qps: Calls per second allowed before failing with `userRateLimitExceeded`, unlimited if `None`.
+        page_size: Largest page returned by list calls.
+        seed: Seed of the random latency and errors."""
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        qps: float | None = None,
+        page_size: int = MAX_PAGE_SIZE,
+        seed: int | None = None,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.qps = qps
+        self.page_size = page_size
+        self.calendars: dict[Calendar, FakeCalendar] = {}
+        self.traffic = Traffic()
+        self._rng = random.Random(seed)
+        self._sequence = itertools.count(1)
+        self._recent: collections.deque[float] = collections.deque()
+        self._lock = threading.RLock()
+
+    def add_calendar(self, summary: str, calendar: Calendar | None = None) -> Calendar:
+        calendar = calendar or f"{uuid.uuid4().hex}@group.calendar.google.com"
+        with self._lock:
+            self.calendars[calendar] = FakeCalendar(summary)
+        return calendar
+
+    def put(self, calendar: Calendar, raw: dict[str, Any]) -> dict[str, Any]:
+        """Store an event without making a request, assigning it an ID if it has none."""
+        with self._lock:
+            event = {**raw, "id": raw.get("id") or uuid.uuid4().hex, "status": "confirmed"}
+            self.calendars[calendar].events[event["id"]] = (next(self._sequence), event)
+            return event
+
+    def events(self, calendar: Calendar) -> list[dict[str, Any]]:
+        """The events of the calendar that have not been deleted."""
+        with self._lock:
+            return [raw for _, raw in self.calendars[calendar].events.values() if raw["status"] != "cancelled"]
+
+    def reset_traffic(self) -> Traffic:
+        with self._lock:
+            traffic, self.traffic = self.traffic, Traffic()
+        return traffic
+
+    def http(self) -> "FakeHttp":
+        return FakeHttp(self)
+
+    def api(self) -> API:
+        """A Calendar API client connected to this server."""
+        return service.client(http=self.http())
+
+    def wait(self) -> None:
+        if delay := self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0):
+            time.sleep(delay)
+
+    def call(self, method: str, uri: str, body: bytes | None) -> Response:
+        """Serve a single API call."""
+        url = urllib.parse.urlsplit(uri)
+        query = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+        path = urllib.parse.unquote(url.path.removeprefix(ROOT))
+        with self._lock:
+            try:
+                name, response = self._route(method, path, query, json.loads(body) if body else None)
+            except Reject as exc:
+                self.traffic.errors[exc.reason] += 1
+                return exc.response()
+            self.traffic.requests[name] += 1
+        if response is not None and (fields := query.get("fields")):
+            response = select(response, parse_fields(fields))
+        return 200 if response is not None else 204, response
+
+    def _route(self, method: str, path: str, query: dict[str, str], body: Any) -> tuple[str, dict[str, Any] | None]:
+        self._limit()
+        if path == "users/me/calendarList" and method == "GET":
+            items = [(i, {"id": cid, "summary": cal.summary}) for i, (cid, cal) in enumerate(self.calendars.items())]
+            return "calendarList.list", self._page(items, query, None)
+        if (m := RE_EVENTS.fullmatch(path)) is None:
+            raise Reject(404, "notFound", f"No method for {method} {path}")
+        if (calendar := self.calendars.get(m["calendar"])) is None:
+            raise Reject(404, "notFound", f"No calendar {m['calendar']}")
+        match method, m["event"]:
+            case "GET", None:
+                return "events.list", self._list(calendar, query)
+            case "POST", None:
+                return "events.insert", self.put(m["calendar"], {**body, "id": None})
+            case "PUT", eid:
+                self._event(calendar, eid)
+                return "events.update", self.put(m["calendar"], {**body, "id": eid})
+            case "DELETE", eid:
+                self._event(calendar, eid)
+                calendar.events[eid] = (next(self._sequence), {"id": eid, "status": "cancelled"})
+                return "events.delete", None
+        raise Reject(405, "methodNotAllowed", f"No method for {method} {path}")
+
+    def _limit(self) -> None:
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise Reject(403, "rateLimitExceeded", "Rate Limit Exceeded")
+        if self.qps is not None:
+            now = time.monotonic()
+            while self._recent and self._recent[0] <= now - 1:
+                self._recent.popleft()
+            if len(self._recent) >= self.qps:
+                raise Reject(403, "userRateLimitExceeded", "User Rate Limit Exceeded")
+            self._recent.append(now)
+
+    def _event(self, calendar: FakeCalendar, eid: str) -> dict[str, Any]:
+        if (entry := calendar.events.get(eid)) is None:
+            raise Reject(404, "notFound", f"No event {eid}")
+        if entry[1]["status"] == "cancelled":
+            raise Reject(410, "deleted", f"Event {eid} has been deleted")
+        return entry[1]
+
+    def _list(self, calendar: FakeCalendar, query: dict[str, str]) -> dict[str, Any]:
+        events = sorted(calendar.events.values(), key=lambda entry: entry[0])
+        if (token := query.get("syncToken")) is not None:
+            if not token.startswith("sync-") or not token[5:].isdigit():
+                raise Reject(410, "fullSyncRequired", "Sync token is no longer valid, a full sync is required")
+            since = int(token[5:])
+            items = [(seq, raw) for seq, raw in events if seq > since]
+        else:
+            items = [(seq, raw) for seq, raw in events if raw["status"] != "cancelled"]
+            if "timeMin" in query or "timeMax" in query:
+                start = _date(query.get("timeMin"), datetime.date.min)
+                end = _date(query.get("timeMax"), datetime.date.max)
+                items = [(seq, raw) for seq, raw in items if _overlaps(raw, start, end)]
+        return self._page(items, query, f"sync-{max((seq for seq, _ in events), default=0)}")
+
+    def _page(
+        self, items: list[tuple[int, dict[str, Any]]], query: dict[str, str], sync_token: str | None
+    ) -> dict[str, Any]:
+        """A page of the `items`, which are ordered by their key.
+
+        The page token is the key of the last item on the page rather than an offset, like the cursors of the API,
+        so items modified while paging move to the end of the listing instead of shifting the following pages."""
+        size = min(int(query.get("maxResults", self.page_size)), self.page_size)
+        after = int(query.get("pageToken") or -1)
+        rest = [(key, raw) for key, raw in items if key > after]
+        page: dict[str, Any] = {"items": [raw for _, raw in rest[:size]]}
+        if len(rest) > size:
+            page["nextPageToken"] = str(rest[size - 1][0])
+        elif sync_token is not None:
+            page["nextSyncToken"] = sync_token
+        return page
+
+    def request(self, uri: str, method: str, body: bytes | None, headers: dict[str, str]) -> tuple[int, str, bytes]:
+        """Serve an HTTP request.
+
+        Returns:
+            The status, content type and content of the response."""
+        with self._lock:
+            self.traffic.round_trips += 1
+            self.traffic.bytes_sent += len(body or b"")
+        self.wait()
+        if urllib.parse.urlsplit(uri).path == BATCH:
+            status, content_type, content = self._batch(body or b"", headers)
+        else:
+            status, response = self.call(method, uri, body)
+            content_type, content = "application/json; charset=UTF-8", _encode(response)
+        with self._lock:
+            self.traffic.bytes_received += len(content)
+        return status, content_type, content
+
+    def _batch(self, body: bytes, headers: dict[str, str]) -> tuple[int, str, bytes]:
+        content_type = next(v for k, v in headers.items() if k.lower() == "content-type")
+        message = email.parser.BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts: list[str] = []
+        for part in message.get_payload():
+            if not isinstance(part, email.message.Message) or not isinstance(request := part.get_payload(), str):
+                raise TypeError("Each part of a batch must be a single HTTP request")
+            line, _, rest = request.partition("\n")
+            method, target, _ = line.split(" ", 2)
+            _, _, payload = rest.replace("\r\n", "\n").partition("\n\n")
+            status, response = self.call(method, target, payload.encode() or None)
+            reason = {200: "OK", 204: "No Content"}.get(status, "Error")
+            cid = part["Content-ID"].strip("<>")
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{cid}>\r\n\r\n"
+                f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{_encode(response).decode()}\r\n"
+            )
+        return 200, f"multipart/mixed; boundary={boundary}", f"{''.join(parts)}--{boundary}--".encode()
+
+
+class FakeHttp:
+    """A `httplib2.Http` compatible transport that sends requests to a `FakeCalendarServer`."""
+
+    def __init__(self, server: FakeCalendarServer) -> None:
+        self.server = server
+
+    def request(
+        self, uri: str, method: str = "GET", body: bytes | str | None = None, headers: dict | None = None, **_: Any
+    ) -> tuple[httplib2.Response, bytes]:
+        if isinstance(body, str):
+            body = body.encode()
+        status, content_type, content = self.server.request(uri, method, body, headers or {})
+        return httplib2.Response({"status": status, "content-type": content_type}), content
+
+    def close(self) -> None:
+        pass
+
+
+class Recorder:
+    """A transport that saves every exchange made through `http` to a JSON lines file, to be replayed later.
+
+    Request headers are not saved, so credentials are not written to the file."""
+
+    def __init__(self, http: Any, filepath: Path) -> None:
+        self.http = http
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    def request(
+        self, uri: str, method: str = "GET", body: bytes | str | None = None, headers: dict | None = None, **kwargs: Any
+    ) -> tuple[httplib2.Response, bytes]:
+        with self._lock:
+            response, content = self.http.request(uri, method, body=body, headers=headers, **kwargs)
+            exchange = {
+                "method": method,
+                "uri": uri,
+                "body": body.decode() if isinstance(body, bytes) else body,
+                "status": response.status,
+                "content_type": response.get("content-type"),
+                "content": content.decode(),
+            }
+            with self.filepath.open("a") as f:
+                f.write(json.dumps(exchange) + "\n")
+        return response, content
+
+    def close(self) -> None:
+        self.http.close()
+
+
+class Replayer:
+    """A transport that responds with the exchanges saved by a `Recorder`.
+
+    Responses are replayed in the order they were recorded for each method and URI.
+    Batch responses are rewritten to match the IDs of the replayed batch request.
+
+    Raises:
+        LookupError: When a request has no recorded response left."""
+
+    def __init__(self, filepath: Path) -> None:
+        self.exchanges: dict[tuple[str, str], collections.deque[dict[str, Any]]] = collections.defaultdict(
+            collections.deque
+        )
+        for line in filepath.read_text().splitlines():
+            if line.strip():
+                exchange = json.loads(line)
+                self.exchanges[(exchange["method"], exchange["uri"])].append(exchange)
+        self._lock = threading.Lock()
+
+    def request(
+        self, uri: str, method: str = "GET", body: bytes | str | None = None, headers: dict | None = None, **_: Any
+    ) -> tuple[httplib2.Response, bytes]:
+        with self._lock:
+            try:
+                exchange = self.exchanges[(method, uri)].popleft()
+            except IndexError:
+                raise LookupError(f"No recorded response to {method} {uri}") from None
+        content: str = exchange["content"]
+        if urllib.parse.urlsplit(uri).path == BATCH and body is not None:
+            body = body.decode() if isinstance(body, bytes) else body
+            bases = {m["id"]: m["base"] for m in RE_CONTENT_ID.finditer(body)}
+            content = RE_CONTENT_ID.sub(
+                lambda m: f"Content-ID: <response-{bases.get(m['id'], m['base'])} + {m['id']}>", content
+            )
+        response = httplib2.Response({"status": exchange["status"], "content-type": exchange["content_type"]})
+        return response, content.encode()
+
+    def close(self) -> None:
+        pass
+
+    def remaining(self) -> Iterator[dict[str, Any]]:
+        """The recorded exchanges that have not been replayed."""
+        return itertools.chain.from_iterable(self.exchanges.values())
+
+
+def record(api: API, filepath: Path) -> API:
+    """Save all the traffic of `api` to `filepath`."""
+    api._http = Recorder(api._http, filepath)  # noqa: SLF001
+    log.info("Recording Calendar API traffic to %s", filepath)
+    return api
+
+
+def replay(filepath: Path) -> API:
+    """A Calendar API client that replays the traffic saved by `record`."""
+    log.info("Replaying Calendar API traffic from %s", filepath)
+    return service.client(http=Replayer(filepath))
+
+
+def parse_fields(fields: str) -> dict[str, Any]:
+    """Parse a partial response field mask, such as `items(id,summary),nextPageToken`.
+
+    Returns:
+        The selected fields, each mapped to the mask of its sub fields, or an empty mask to select all of it."""
+    tokens = re.findall(r"[^,()]+|[,()]", fields.replace(" ", ""))
+    stack: list[dict[str, Any]] = [{}]
+    last = ""
+    for token in tokens:
+        match token:
+            case "(":
+                stack.append(stack[-1].setdefault(last, {}))
+            case ")":
+                stack.pop()
+            case ",":
+                pass
+            case _:
+                node = stack[-1]
+                *parents, last = token.split("/")
+                for parent in parents:
+                    node = node.setdefault(parent, {})
+                node.setdefault(last, {})
+    return stack[0]
+
+
+def select(data: Any, mask: dict[str, Any]) -> Any:
+    """Keep only the fields of `data` in the `mask`."""
+    if not mask:
+        return data
+    if isinstance(data, list):
+        return [select(item, mask) for item in data]
+    if isinstance(data, dict):
+        return {key: select(data[key], sub) for key, sub in mask.items() if key in data}
+    return data
+
+
+def _encode(response: dict[str, Any] | None) -> bytes:
+    return b"" if response is None else json.dumps(response).encode()
+
+
+def _date(value: str | None, default: datetime.date) -> datetime.date:
+    return default if value is None else datetime.datetime.fromisoformat(value).date()
+
+
+def _overlaps(raw: dict[str, Any], start: datetime.date, end: datetime.date) -> bool:
+    event = EventView(raw)
+    first = event.time_start().date()
+    return first < end and max((first, *event.occurrences())) >= start
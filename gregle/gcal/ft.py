@@ -1,5 +1,48 @@
+import datetime
+import functools
+from zoneinfo import ZoneInfo
+
+from gregle import tz
+
 RFC5545_DATE = "%Y%m%d"
 RFC5545_DATETIME_LOCAL = "%Y%m%dT%H%M%S"
 RFC3339_DATETIME = "%Y-%m-%dT%H:%M:%S%z"
 RFC3339_DATETIME_UTC = "%Y-%m-%dT%H:%M:%SZ"
 RFC3339_DATETIME_LOCAL = "%Y-%m-%dT%H:%M:%S"
+
+
+@functools.cache
+def zone(key: str) -> ZoneInfo:
+    return ZoneInfo(key)
+
+
+def parse_rfc3339(value: str, timezone: str | None = None) -> datetime.datetime:
+    """Parse an RFC3339 date-time.
+
+    Args:
+        value: The date-time, with or without a UTC offset.
+        timezone: The IANA timezone of the date-time, local date-times are assumed to be in the default timezone.
+
+    Returns:
+        An aware `datetime` in `timezone` if it is given."""
+    time = datetime.datetime.fromisoformat(value)
+    info = zone(timezone) if timezone is not None else None
+    if time.tzinfo is None:
+        return time.replace(tzinfo=info or tz.DEFAULT)
+    return time if info is None else time.astimezone(info)
+
+
+def format_rfc3339_local(time: datetime.datetime) -> str:
+    """Format the local date-time, equivalent to `RFC3339_DATETIME_LOCAL`."""
+    return time.replace(tzinfo=None, microsecond=0).isoformat()
+
+
+def parse_rfc5545_date(value: str) -> datetime.date:
+    """Parse the date of an RFC5545 date or date-time."""
+    return datetime.date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+
+
+def format_rfc5545_local(dates: list[datetime.date], time: datetime.time) -> list[str]:
+    """Format each date at the same local time, equivalent to `RFC5545_DATETIME_LOCAL`."""
+    suffix = f"T{time.hour:02d}{time.minute:02d}{time.second:02d}"
+    return [f"{d.year:04d}{d.month:02d}{d.day:02d}{suffix}" for d in dates]
@@ -0,0 +1,165 @@
+import datetime
+import json
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Self
+
+from googleapiclient.errors import HttpError
+
+from .. import path as PATH
+from ..log import log
+from ..metrics import metrics
+from .cal import EVENTS_FIELDS, EVENTS_PAGE_SIZE
+from .event import FIELDS, EventView
+from .service import API, Calendar
+
+
+@dataclass
+class Mirror:
+    """Local copy of a remote calendar, kept up to date with sync tokens.
+
+    Attributes:
+        calendar: The ID of the mirrored calendar.
+        sync_token: Token to fetch changes since the last sync, `None` if a full sync is required.
+        items: The raw remote events by their ID."""
+
+    calendar: Calendar
+    sync_token: str | None = None
+    items: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, filepath: Path, calendar: Calendar) -> Self:
+        """Load the mirror of `calendar`, returning an empty mirror if there is none."""
+        try:
+            data = json.loads(filepath.read_text())
+        except (FileNotFoundError, ValueError):
+            return cls(calendar)
+        if data.get("calendar") != calendar:
+            return cls(calendar)
+        return cls(calendar, data.get("syncToken"), data.get("items", {}))
+
+    def save(self, filepath: Path) -> None:
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        tmp = filepath.with_name(filepath.name + ".tmp")
+        tmp.write_text(json.dumps({"calendar": self.calendar, "syncToken": self.sync_token, "items": self.items}))
+        tmp.replace(filepath)
+
+    def reset(self) -> None:
+        self.sync_token = None
+        self.items.clear()
+
+    def merge(self, item: dict[str, Any]) -> None:
+        """Apply a changed or deleted remote event to the mirror."""
+        if item.get("status") == "cancelled":
+            self.items.pop(item["id"], None)
+        else:
+            self.items[item["id"]] = {key: item[key] for key in FIELDS if key in item}
+
+    def events(self, start: datetime.date | None = None, end: datetime.date | None = None) -> Iterator[EventView]:
+        """The mirrored events, optionally only those with an occurrence overlapping [start, end)."""
+        for raw in self.items.values():
+            event = EventView(raw)
+            if start is None or end is None or _overlaps(event, start, end):
+                yield event
+
+
+def _overlaps(event: EventView, start: datetime.date, end: datetime.date) -> bool:
+    first = event.time_start().date()
+    last = max((first, *event.occurrences()))
+    return first < end and last >= start
+
+
+def filepath(calendar: Calendar, cache_dir: Path | None = None) -> Path:
+    return (cache_dir or PATH.CACHE) / "mirror" / f"{calendar}.json"
+
+
+def sync(api: API, mirror: Mirror) -> Mirror:
+    """Bring the `mirror` up to date with the remote calendar.
+
+    Only the events changed since the last sync are fetched.
+    A full sync is made if there is no sync token or the server has invalidated it."""
+    update(api, mirror)
+    return mirror
+
+
+def update(api: API, mirror: Mirror) -> int | None:
+    """Bring the `mirror` up to date with the remote calendar, see `sync`.
+
+    Returns:
+        The number of events changed since the last sync, `None` if a full sync was made."""
+    full = mirror.sync_token is None
+    metrics.count("gregle_cache_misses_total" if full else "gregle_cache_hits_total", cache="mirror")
+    try:
+        changed = sum(1 for _ in _changes(api, mirror))
+    except HttpError as exc:
+        if exc.status_code != 410:
+            raise
+        _resync(api, mirror)
+        return None
+    return None if full else changed
+
+
+def stream(
+    api: API, mirror: Mirror, start: datetime.date | None = None, end: datetime.date | None = None
+) -> Iterator[EventView]:
+    """Bring the `mirror` up to date like `sync`, yielding its events as they become known.
+
+    The events changed since the last sync are yielded as their pages arrive. The unchanged events are yielded once
+    every page has been fetched, as a later page could still change them. Optionally only the events with an
+    occurrence overlapping [start, end) are yielded, as in `Mirror.events`."""
+    full = mirror.sync_token is None
+    metrics.count("gregle_cache_misses_total" if full else "gregle_cache_hits_total", cache="mirror")
+    seen: set[str] = set()
+    try:
+        for item in _changes(api, mirror):
+            if item["id"] in seen:
+                continue
+            seen.add(item["id"])
+            if (raw := mirror.items.get(item["id"])) is not None:
+                event = EventView(raw)
+                if start is None or end is None or _overlaps(event, start, end):
+                    yield event
+    except HttpError as exc:
+        if exc.status_code != 410:
+            raise
+        _resync(api, mirror)
+    for eid, raw in mirror.items.items():
+        if eid not in seen:
+            event = EventView(raw)
+            if start is None or end is None or _overlaps(event, start, end):
+                yield event
+
+
+def _resync(api: API, mirror: Mirror) -> None:
+    log.warning("Sync token for %s expired, resyncing", mirror.calendar)
+    metrics.count("gregle_cache_misses_total", cache="mirror")
+    mirror.reset()
+    for _ in _changes(api, mirror):
+        pass
+
+
+def _changes(api: API, mirror: Mirror) -> Iterator[dict[str, Any]]:
+    """Fetch the events changed since the last sync into the `mirror`, yielding each item once it has been merged."""
+    page_token: str | None = None
+    kind = "Incremental" if mirror.sync_token else "Full"
+
+    while True:
+        log.info(f"Request: Events Sync - {kind}")
+        res: dict = (
+            api.events()
+            .list(
+                calendarId=mirror.calendar,
+                syncToken=mirror.sync_token,
+                pageToken=page_token,
+                maxResults=EVENTS_PAGE_SIZE,
+                fields=EVENTS_FIELDS,
+            )
+            .execute()
+        )
+        for item in res.get("items", []):
+            mirror.merge(item)
+            yield item
+        if (page_token := res.get("nextPageToken")) is None:
+            break
+    mirror.sync_token = res.get("nextSyncToken")
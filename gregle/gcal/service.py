@@ -1,25 +1,76 @@
+import contextlib
+import functools
 import os
+import queue
+import threading
+from collections.abc import Iterator
+from pathlib import Path
 from typing import Any, TypeAlias
 
 import google.auth.exceptions
-from google.auth.transport.requests import Request
+import google_auth_httplib2
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, build_http
 
 from .. import path as PATH
 from ..log import log
+from ..metrics import metrics
 
 API: TypeAlias = Any
 Calendar: TypeAlias = str
 
 
+class MeteredRequest(HttpRequest):
+    """An `HttpRequest` that records its calls, failures and bytes in `metrics`."""
+
+    def __init__(
+        self,
+        http: Any,
+        postproc: Any,
+        uri: str,
+        method: str = "GET",
+        body: Any = None,
+        headers: dict | None = None,
+        methodId: str | None = None,  # noqa: N803
+        resumable: Any = None,
+    ) -> None:
+        def metered(resp: Any, content: bytes) -> Any:
+            metrics.count("gregle_api_bytes_received_total", len(content or b""))
+            return postproc(resp, content)
+
+        super().__init__(http, metered, uri, method, body, headers, methodId, resumable)
+
+    def execute(self, http: Any = None, num_retries: int = 0) -> Any:
+        record_request(self)
+        metrics.count("gregle_api_round_trips_total")
+        try:
+            return super().execute(http=http, num_retries=num_retries)
+        except HttpError as exc:
+            record_error(self, exc)
+            raise
+
+
+def record_request(request: HttpRequest) -> None:
+    """Count a call made by `request`, whether on its own or in a batch."""
+    metrics.count("gregle_api_requests_total", method=request.methodId or request.method)
+    metrics.count("gregle_api_bytes_sent_total", len(request.body or b""))
+
+
+def record_error(request: HttpRequest, exc: HttpError) -> None:
+    metrics.count("gregle_api_errors_total", method=request.methodId or request.method, status=str(exc.status_code))
+    metrics.count("gregle_api_bytes_received_total", len(exc.content or b""))
+
+
 def _scope_creds(scopes: list[str], token_file: str, creds_file: str):
     creds = None
     if os.path.exists(token_file):
         creds = Credentials.from_authorized_user_file(token_file, scopes)
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
+            # Only needed to refresh the token, and slow to import
+            from google.auth.transport.requests import Request
+
             try:
                 creds.refresh(Request())
             except google.auth.exceptions.RefreshError as e:
@@ -27,25 +78,112 @@ def _scope_creds(scopes: list[str], token_file: str, creds_file: str):
                 os.remove(token_file)
                 return _scope_creds(scopes, token_file, creds_file)
         else:
+            # Only needed to sign in, and slow to import
+            from google_auth_oauthlib.flow import InstalledAppFlow
+
             flow = InstalledAppFlow.from_client_secrets_file(creds_file, scopes)
             log.info("Waiting for Authentication!")
             creds = flow.run_local_server(port=0)
 
         # Save the credentials for the next run
+        Path(token_file).parent.mkdir(parents=True, exist_ok=True)
         with open(token_file, "w") as token:
             token.write(creds.to_json())
 
     return creds
 
 
-def calendar() -> API:
+@functools.cache
+def discovery() -> str:
+    """The Calendar API discovery document, read from the copy bundled with the client library once per process."""
+    from googleapiclient.discovery_cache import get_static_doc
+
+    document = get_static_doc("calendar", "v3")
+    if document is None:
+        raise FileNotFoundError("The client library has no bundled Calendar API discovery document")
+    return document
+
+
+def client(*, credentials: Any = None, http: Any = None) -> API:
+    """Build a Calendar API client from the bundled discovery document, without fetching it.
+
+    Args:
+        credentials: Authorise the requests of the client with these credentials.
+        http: The transport of the client, instead of one authorised with `credentials`."""
+    from googleapiclient.discovery import build_from_document
+
+    return build_from_document(discovery(), credentials=credentials, http=http, requestBuilder=MeteredRequest)
+
+
+def calendar(token_file: Path | None = None, creds_file: Path | None = None) -> API:
+    """Connect to the Calendar API.
+
+    Args:
+        token_file: Where the user's credentials are saved, defaults to the cache.
+        creds_file: The OAuth client secrets, defaults to the resources."""
     log.info("Connecting to Calendar Service")
     creds = _scope_creds(
         [
             "https://www.googleapis.com/auth/calendar.readonly",
             "https://www.googleapis.com/auth/calendar.events",
         ],
-        str(PATH.CACHE / "token.json"),
-        str(PATH.RES / "client_secret.json"),
+        str(token_file or PATH.CACHE / "token.json"),
+        str(creds_file or PATH.RES / "client_secret.json"),
     )
-    return build("calendar", "v3", credentials=creds)
+    return client(credentials=creds)
+
+
+def thread_http(api: API) -> Any:
+    """Create a new authorised HTTP transport sharing the credentials of `api`.
+
+    `httplib2` connections are not thread-safe, so each thread must use its own transport.
+    Other transports, such as those of `fake`, are thread-safe and are shared."""
+    http = api._http  # noqa: SLF001
+    if not isinstance(http, google_auth_httplib2.AuthorizedHttp):
+        return http
+    return google_auth_httplib2.AuthorizedHttp(http.credentials, http=build_http())
+
+
+class HttpPool:
+    """Thread-safe pool of authorised HTTP transports sharing the credentials of an API client.
+
+    Each transport is used by a single thread at a time and keeps its connection alive between requests,
+    so at most `size` connections are opened however many requests are made.
+    Transports are created as they are first needed, up to `size`."""
+
+    def __init__(self, api: API, size: int) -> None:
+        self.api = api
+        self.size = max(size, 1)
+        self._idle: queue.LifoQueue[Any] = queue.LifoQueue()
+        self._created: list[Any] = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """Borrow a transport, waiting for one to be returned if all `size` are in use."""
+        http = self._take()
+        try:
+            yield http
+        finally:
+            # Most recently used first, as its connection is the most likely to still be open
+            self._idle.put(http)
+
+    def _take(self) -> Any:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._created) < self.size:
+                http = thread_http(self.api)
+                self._created.append(http)
+                return http
+        return self._idle.get()
+
+    def close(self) -> None:
+        """Close the connections of every transport in the pool."""
+        with self._lock:
+            for http in self._created:
+                if http is not self.api._http:  # noqa: SLF001
+                    http.close()
+            self._created.clear()
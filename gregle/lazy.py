@@ -0,0 +1,37 @@
+import importlib
+import sys
+from collections.abc import Callable
+from typing import Any
+
+
+def attach(
+    package: str, submodules: list[str], attributes: dict[str, tuple[str, str]]
+) -> tuple[Callable[[str], Any], Callable[[], list[str]]]:
+    """Export the submodules and attributes of a package without importing them until they are first used.
+
+    An attribute must not share its name with a submodule, as importing the submodule would replace it.
+
+    Args:
+        package: The `__name__` of the package.
+        submodules: The submodules to export.
+        attributes: The attributes to export by name, as the submodule and the name they are defined by.
+
+    Returns:
+        The `__getattr__` and `__dir__` of the package."""
+
+    def __getattr__(name: str) -> Any:  # noqa: N807
+        if name in submodules:
+            value = importlib.import_module(f"{package}.{name}")
+        elif name in attributes:
+            module, attribute = attributes[name]
+            value = getattr(importlib.import_module(f"{package}.{module}"), attribute)
+        else:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        # Cache the export, so later lookups do not go through __getattr__
+        setattr(sys.modules[package], name, value)
+        return value
+
+    def __dir__() -> list[str]:  # noqa: N807
+        return sorted({*vars(sys.modules[package]), *submodules, *attributes})
+
+    return __getattr__, __dir__
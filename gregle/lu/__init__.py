@@ -1,8 +1,30 @@
+from typing import TYPE_CHECKING
+
+from .. import lazy
+
+# These exports share their names with their submodules, so they are not lazy
 from .address import address
-from .diff import Diff
+from .diff import Diff, StreamingDiff
 from .diff import changes as diff
-from .event import EventInstance as Event
-from .event import EventSchedule as Events
-from .ri import events
 
-__all__ = ["address", "Diff", "diff", "Event", "Events", "events"]
+if TYPE_CHECKING:
+    from . import dates, event, index, page, ri, session, store, timetable
+    from .event import EventInstance as Event
+    from .event import EventSchedule as Events
+    from .index import EventIndex as Index
+    from .ri import events
+    from .store import EventStore as Store
+
+__getattr__, __dir__ = lazy.attach(
+    __name__,
+    ["dates", "event", "index", "page", "ri", "session", "store", "timetable"],
+    {
+        "Event": ("event", "EventInstance"),
+        "Events": ("event", "EventSchedule"),
+        "Index": ("index", "EventIndex"),
+        "events": ("ri", "events"),
+        "Store": ("store", "EventStore"),
+    },
+)
+
+__all__ = ["address", "Diff", "diff", "StreamingDiff", "Event", "Events", "events", "Index", "Store"]
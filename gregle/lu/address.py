@@ -1,36 +1,99 @@
-BUILDING = {
-    "DAV": "Loughborough University Physics Department, Epinal Way, Loughborough LE11 3TU",
-    "EHB": "EHB, Margaret Keay Rd, Loughborough LE11 3TU",
-    "LDS": "Loughborough Design School, Loughborough University, Loughborough LE11 3TU",
-    "MHL": "Martin Hall, Epinal Way, Loughborough LE11 3TS",
-    "MST": "Microsoft Teams",
-    "SCH": "Schofield Building, University Rd, Loughborough LE11 3TU",
-    "SMB": "Stewart Mason Building, Margaret Keay Rd, Loughborough LE11 3TU",
-    "WAV": "Wavy Top, Loughborough LE11 3TU",
-    "WPL": "STEMLab, University Rd, Loughborough LE11 3TL",
-    "WPT": "West Park Teaching Hub, 2 Oakwood Dr, Loughborough LE11 3QF",
-    "CC": "James France, Margaret Keay Rd, Loughborough LE11 3TW",
-    "RT": "Sir Frank Gibb, Frank Gibb (Sir) Building, Loughborough LE11 3UE",
-    "TW": "Wolfson School of Mechanical, Electrical and Manufacturing Engineering, Loughborough University, Wolfson Building, Ashby Rd, Loughborough LE11 3TU",
-    "HH": "John Pickford, Mumford Way, Loughborough LE11 3US",
-    "N": "Haslegrave Building, University Rd, Loughborough LE11 3TP",
-    "U": "Brockington Building, Loughborough University, Margaret Keay Rd, Loughborough LE11 3TU",
-    "B": "Brockington Building, Loughborough University, Margaret Keay Rd, Loughborough LE11 3TU",
-    "E": "E Building - Department of International Relations, Politics, and History, Facilities Management Building, Loughborough LE11 3TU",
-    "G": "G Block, Loughborough LE11 3TU",
-    "T": "Wolfson School of Mechanical, Electrical and Manufacturing Engineering, Loughborough University, Wolfson Building, Ashby Rd, Loughborough LE11 3TU",
-    "S": "S building, Loughborough LE11 3UE",
-}
-
-BUILDING_CODES = tuple(sorted(BUILDING.keys(), key=len, reverse=True))
+import functools
+import hashlib
+import json
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Self
+
+from .. import path as PATH
+
+FILE = PATH.RES / "rooms.json"
+"""The room directory, mapping the prefix of a room code to the address of its building."""
+
+
+class _Node:
+    __slots__ = ("children", "value")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _Node] = {}
+        self.value: str | None = None
+
+
+class RoomDirectory:
+    """The addresses of rooms, found by the longest building code their room code starts with.
+
+    The building codes are compiled into a prefix trie, so a lookup walks the room code once
+    instead of trying every building code. Results are memoised, including rooms with no building."""
+
+    def __init__(self, buildings: dict[str, str]) -> None:
+        self.buildings = buildings
+        self._root = _Node()
+        for code, address in buildings.items():
+            node = self._root
+            for char in code:
+                node = node.children.setdefault(char, _Node())
+            node.value = address
+        self._addresses: dict[str, str | None] = {}
+        self._rooms: dict[tuple[str, ...], str | None] = {}
+
+    @classmethod
+    def load(cls, filepath: Path) -> Self:
+        data = json.loads(filepath.read_text(encoding="utf-8"))
+        return cls(data.get("buildings", {}))
+
+    def building(self, code: str) -> str | None:
+        """The address of the building of the room `code`, `None` if it is not mapped."""
+        node, found = self._root, None
+        for char in code:
+            if (child := node.children.get(char)) is None:
+                break
+            node = child
+            if node.value is not None:
+                found = node.value
+        return found
+
+    def address(self, code: str) -> str | None:
+        """The address of the room `code`, `None` if its building is not mapped."""
+        try:
+            return self._addresses[code]
+        except KeyError:
+            pass
+        building = self.building(code)
+        address = self._addresses[code] = None if building is None else f"{code}, {building}"
+        return address
+
+    def resolve(self, rooms: tuple[str, ...]) -> str | None:
+        """The address of the first of the `rooms` that is mapped, `None` if none are."""
+        try:
+            return self._rooms[rooms]
+        except KeyError:
+            pass
+        address = self._rooms[rooms] = next(filter(None, map(self.address, rooms)), None)
+        return address
+
+    def unmapped(self, codes: Iterable[str]) -> list[str]:
+        """The distinct room `codes` whose building is not mapped, in sorted order."""
+        return sorted({code for code in codes if self.address(code) is None})
+
+
+@functools.cache
+def directory() -> RoomDirectory:
+    """The room directory loaded from `FILE`, loaded once when it is first used."""
+    return RoomDirectory.load(FILE)
+
+
+def digest() -> str:
+    """A hash of the room directory in `FILE`, to tell when the addresses of rooms have changed."""
+    return hashlib.sha256(FILE.read_bytes()).hexdigest()[:32]
 
 
 def building(code: str) -> str:
-    for b in BUILDING_CODES:
-        if code.startswith(b):
-            return BUILDING[b]
-    raise KeyError(f"Building '{code}' is not Mapped!")
+    if (address := directory().building(code)) is None:
+        raise KeyError(f"Building '{code}' is not Mapped!")
+    return address
 
 
 def address(code: str) -> str:
-    return f"{code}, {building(code)}"
+    if (found := directory().address(code)) is None:
+        raise KeyError(f"Building '{code}' is not Mapped!")
+    return found
@@ -0,0 +1,143 @@
+import datetime
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Any, Self, overload
+
+
+class DateSet(Sequence[datetime.date]):
+    """An immutable set of dates, stored as a bitmask of days after its first date.
+
+    It is a sequence of its dates in ascending order, so it can be used wherever a sorted list of dates is.
+    Union, intersection, difference and equality are integer operations on the masks,
+    instead of work on each date.
+
+    Bit `i` of the mask is set if the date with ordinal `origin + i` is in the set.
+    The set is normalised so that bit 0 is set, or both are 0 when it is empty, making equal sets identical.
+    An empty set is never aligned to, as its origin is meaningless."""
+
+    __slots__ = ("mask", "origin")
+
+    origin: int
+    mask: int
+
+    def __init__(self, dates: Iterable[datetime.date] = ()) -> None:
+        self.origin, self.mask = _mask(date.toordinal() for date in dates)
+
+    @classmethod
+    def from_mask(cls, origin: int, mask: int) -> Self:
+        """The dates with ordinal `origin + i` for each bit `i` set in `mask`, which must not be negative."""
+        obj = cls.__new__(cls)
+        if mask & 1:
+            obj.origin, obj.mask = origin, mask
+        elif mask:
+            shift = (mask & -mask).bit_length() - 1
+            obj.origin, obj.mask = origin + shift, mask >> shift
+        else:
+            obj.origin, obj.mask = 0, 0
+        return obj
+
+    @classmethod
+    def from_ordinals(cls, ordinals: Iterable[int]) -> Self:
+        obj = cls.__new__(cls)
+        obj.origin, obj.mask = _mask(ordinals)
+        return obj
+
+    def ordinals(self) -> Iterator[int]:
+        """The ordinals of the dates, in ascending order."""
+        origin, mask = self.origin, self.mask
+        while mask:
+            low = mask & -mask
+            yield origin + low.bit_length() - 1
+            mask ^= low
+
+    def between(self, start: datetime.date, end: datetime.date) -> Self:
+        """The dates in [start, end)."""
+        lo = max(start.toordinal() - self.origin, 0)
+        hi = max(end.toordinal() - self.origin, 0)
+        return self.from_mask(self.origin, self.mask & ((1 << hi) - 1) & ~((1 << lo) - 1))
+
+    def _align(self, other: "DateSet") -> tuple[int, int, int]:
+        """The lowest origin of the two sets, and both masks relative to it."""
+        if self.origin <= other.origin:
+            return self.origin, self.mask, other.mask << (other.origin - self.origin)
+        return other.origin, self.mask << (self.origin - other.origin), other.mask
+
+    def __or__(self, other: "DateSet") -> Self:
+        if not isinstance(other, DateSet):
+            return NotImplemented
+        if not other.mask:
+            return self
+        if not self.mask:
+            return self.from_mask(other.origin, other.mask)
+        origin, a, b = self._align(other)
+        return self.from_mask(origin, a | b)
+
+    def __and__(self, other: "DateSet") -> Self:
+        if not isinstance(other, DateSet):
+            return NotImplemented
+        if not self.mask or not other.mask:
+            return self.from_mask(0, 0)
+        origin, a, b = self._align(other)
+        return self.from_mask(origin, a & b)
+
+    def __sub__(self, other: "DateSet") -> Self:
+        if not isinstance(other, DateSet):
+            return NotImplemented
+        if not self.mask or not other.mask:
+            return self
+        origin, a, b = self._align(other)
+        return self.from_mask(origin, a & ~b)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, DateSet):
+            return self.origin == other.origin and self.mask == other.mask
+        if isinstance(other, list | tuple):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((self.origin, self.mask))
+
+    def __len__(self) -> int:
+        return self.mask.bit_count()
+
+    def __bool__(self) -> bool:
+        return self.mask != 0
+
+    def __iter__(self) -> Iterator[datetime.date]:
+        return map(datetime.date.fromordinal, self.ordinals())
+
+    def __contains__(self, value: Any) -> bool:
+        if not isinstance(value, datetime.date):
+            return False
+        offset = value.toordinal() - self.origin
+        return offset >= 0 and (self.mask >> offset) & 1 == 1
+
+    @overload
+    def __getitem__(self, index: int) -> datetime.date: ...
+    @overload
+    def __getitem__(self, index: slice) -> Self: ...
+    def __getitem__(self, index: int | slice) -> datetime.date | Self:
+        if isinstance(index, slice):
+            if index == slice(1, None):
+                # The occurrences after the first date, drop the lowest bit
+                return self.from_mask(self.origin, self.mask & (self.mask - 1))
+            return self.from_ordinals(list(self.ordinals())[index])
+        if not self.mask:
+            raise IndexError("DateSet index out of range")
+        if index == 0:
+            return datetime.date.fromordinal(self.origin)
+        if index == -1:
+            return datetime.date.fromordinal(self.origin + self.mask.bit_length() - 1)
+        return datetime.date.fromordinal(list(self.ordinals())[index])
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)!r})"
+
+
+def _mask(ordinals: Iterable[int]) -> tuple[int, int]:
+    ordinals = list(ordinals)
+    origin = min(ordinals, default=0)
+    mask = 0
+    for ordinal in ordinals:
+        mask |= 1 << (ordinal - origin)
+    return origin, mask
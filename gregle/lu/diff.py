@@ -1,36 +1,199 @@
+import datetime
 from collections import defaultdict
 from collections.abc import Iterable, Iterator
-from typing import Literal
 
 from ..event import Diff
+from .dates import DateSet
 from .event import EventSchedule, GroupID
 
+MAX_FRAGMENTS = 4
+"""Maximum number of events a group is split across before new dates are merged into an existing event."""
+
 
 def changes(a: Iterable[EventSchedule], b: Iterable[EventSchedule]) -> Iterator[Diff[EventSchedule]]:
-    tbl: dict[GroupID, list[tuple[Literal["a", "b"], EventSchedule]]] = defaultdict(list)
+    """Find the changes that turn the events `a` into the events `b`.
+
+    Events are matched by their `GroupID`, a group may be spread over several events in `a`.
+    The dates of the group are reassigned to the existing events so that only events
+    which lose dates, or change details, are updated and events on the right dates are left alone."""
+    tbl: dict[GroupID, tuple[list[EventSchedule], list[EventSchedule]]] = defaultdict(lambda: ([], []))
     for e in a:
-        tbl[e.instance.group()].append(("a", e))
+        tbl[e.instance.group()][0].append(e)
     for e in b:
-        tbl[e.instance.group()].append(("b", e))
-
-    for vals in tbl.values():
-        match vals:
-            case [("a", lhs), ("b", rhs)]:
-                if _is_diff(lhs, rhs):
-                    yield ("update", (lhs, rhs))
-            case [("a", e)]:
-                yield ("delete", e)
-            case [("b", e)]:
+        tbl[e.instance.group()][1].append(e)
+
+    for lhs, rhs in tbl.values():
+        match lhs, rhs:
+            case [*_], []:
+                for e in lhs:
+                    yield ("delete", e)
+            case [], [e]:
                 yield ("create", e)
-            case [("a", a_first), *a_rest, ("b", rhs)]:
-                lhs = EventSchedule.combine(a_first, *(i[1] for i in a_rest), eid=a_first.id())
-                for e in a_rest:
-                    yield ("delete", e[1])
-                yield ("update", (lhs, rhs))
-                raise NotImplementedError
-            case x:
-                raise ValueError(x)
-
-
-def _is_diff(a: EventSchedule, b: EventSchedule) -> bool:
-    return a.on_dates != b.on_dates or a.instance != b.instance
+            case [], [first, *rest]:
+                yield ("create", EventSchedule.combine(first, *rest))
+            case [*_], [e]:
+                yield from _group_changes(lhs, e)
+            case [*_], [first, *rest]:
+                yield from _group_changes(lhs, EventSchedule.combine(first, *rest))
+
+
+def _group_changes(lhs: list[EventSchedule], rhs: EventSchedule) -> Iterator[Diff[EventSchedule]]:
+    """Find the changes that turn the events `lhs`, which all share a group, into the single event `rhs`.
+
+    Each date of `rhs` is kept on the first event in `lhs` that already has it.
+    Events left with no dates are deleted and events that lose dates are shrunk.
+    Any new dates are added to an event that is already being updated, otherwise they are moved to an event
+    that would be deleted, or split into a new event while the group has fewer than `MAX_FRAGMENTS` events."""
+    desired = rhs.on_dates
+    covered = DateSet()
+    kept: list[EventSchedule] = []
+    updates: list[tuple[EventSchedule, EventSchedule]] = []
+    deleted: list[EventSchedule] = []
+
+    for e in lhs:
+        dates = (e.on_dates & desired) - covered
+        covered |= dates
+        if not dates:
+            deleted.append(e)
+        elif dates == e.on_dates and e.instance == rhs.instance:
+            kept.append(e)
+        else:
+            updates.append((e, EventSchedule(e.id(), rhs.instance, dates)))
+
+    created: EventSchedule | None = None
+    if missing := desired - covered:
+        extra = EventSchedule(None, rhs.instance, missing)
+        if updates:
+            old, new = updates[0]
+            updates[0] = (old, EventSchedule.combine(new, extra, eid=new.id()))
+        elif len(kept) >= MAX_FRAGMENTS:
+            smallest = min(kept, key=lambda e: len(e.on_dates))
+            updates.append((smallest, EventSchedule.combine(smallest, extra, eid=smallest.id())))
+        elif deleted:
+            # Moving an event to the new dates is one change, deleting it and creating another is two
+            old = deleted.pop(0)
+            updates.append((old, EventSchedule(old.id(), rhs.instance, missing)))
+        else:
+            created = extra
+
+    for e in deleted:
+        yield ("delete", e)
+    if created is not None:
+        yield ("create", created)
+    for update in updates:
+        yield ("update", update)
+
+
+class StreamingDiff:
+    """Find the changes that turn a stream of existing events into the events `b`, as the existing events arrive.
+
+    An existing event is updated as soon as it is known to hold dates or details that differ from its group in `b`,
+    using the same date reassignment as `changes`. Deletions, creations and dates no existing event covers
+    can only be known once every existing event has been seen, so they are found by `finish`.
+    The changes of `finish` must only be applied after those found while streaming have completed.
+
+    With a `window`, only the dates in [start, end) are diffed and `b` must only have dates in the window.
+    Existing events keep their dates outside the window, if their details change in the window
+    the dates in the window are split into a new event. Existing events entirely outside the window are ignored."""
+
+    def __init__(self, b: Iterable[EventSchedule], window: tuple[datetime.date, datetime.date] | None = None) -> None:
+        grouped: dict[GroupID, list[EventSchedule]] = defaultdict(list)
+        for e in b:
+            grouped[e.instance.group()].append(e)
+        self.desired = {group: EventSchedule.combine(*events) for group, events in grouped.items()}
+        self.covered: dict[GroupID, DateSet] = defaultdict(DateSet)
+        self.kept: dict[GroupID, list[EventSchedule]] = defaultdict(list)
+        self.updated: dict[GroupID, list[EventSchedule]] = defaultdict(list)
+        self.exact: set[GroupID] = set()
+        self.deleted: list[EventSchedule] = []
+        self.window = window
+        self.outside: dict[str | None, EventSchedule] = {}
+        self.split: dict[str | None, EventSchedule] = {}
+
+    def match(self, e: EventSchedule) -> None:
+        """Keep the existing event `e`, which is known to be identical to its group in `b`.
+
+        Any other events of the group, seen before or after, are deleted."""
+        group = e.instance.group()
+        self.exact.add(group)
+        self.deleted.extend(self.kept.pop(group, ()))
+        self.deleted.extend(self.updated.pop(group, ()))
+
+    def add(self, e: EventSchedule) -> Iterator[Diff[EventSchedule]]:
+        """Diff the existing event `e`, yielding its update if it is known to need one."""
+        if self.window is not None:
+            if (inside := e.clip(*self.window)) is None:
+                return
+            if inside.on_dates != e.on_dates:
+                outside = e.on_dates - inside.on_dates
+                self.outside[e.id()] = EventSchedule(e.id(), e.instance, outside)
+                e = inside
+        group = e.instance.group()
+        if (rhs := self.desired.get(group)) is None or group in self.exact:
+            self.deleted.append(e)
+            return
+        dates = (e.on_dates & rhs.on_dates) - self.covered[group]
+        self.covered[group] |= dates
+        if not dates:
+            self.deleted.append(e)
+        elif dates == e.on_dates and e.instance == rhs.instance:
+            self.kept[group].append(e)
+        else:
+            new = EventSchedule(e.id(), rhs.instance, dates)
+            self.updated[group].append(new)
+            yield from self._restore(("update", (e, new)))
+
+    def finish(self) -> Iterator[Diff[EventSchedule]]:
+        """The changes that remain once every existing event has been seen."""
+        for change in self._finish():
+            yield from self._restore(change)
+        for e in self.split.values():
+            yield ("create", e)
+        self.split.clear()
+
+    def _finish(self) -> Iterator[Diff[EventSchedule]]:
+        # Events that would be deleted can be moved to the dates of their group that no event covers
+        spare: dict[GroupID, list[EventSchedule]] = defaultdict(list)
+        for e in self.deleted:
+            if (group := e.instance.group()) in self.desired and group not in self.exact:
+                spare[group].append(e)
+        changes: list[Diff[EventSchedule]] = []
+        reused: set[int] = set()
+        for group, rhs in self.desired.items():
+            if group in self.exact or not (missing := rhs.on_dates - self.covered[group]):
+                continue
+            # The updates have already been made, so new dates cannot be merged into them for free
+            kept, updated = self.kept[group], self.updated[group]
+            if kept and len(kept) + len(updated) >= MAX_FRAGMENTS:
+                smallest = min(kept, key=lambda e: len(e.on_dates))
+                extra = EventSchedule(None, rhs.instance, missing)
+                changes.append(("update", (smallest, EventSchedule.combine(smallest, extra, eid=smallest.id()))))
+            elif spare[group]:
+                old = spare[group].pop(0)
+                reused.add(id(old))
+                changes.append(("update", (old, EventSchedule(old.id(), rhs.instance, missing))))
+            elif not kept and not updated:
+                changes.append(("create", rhs))
+            else:
+                changes.append(("create", EventSchedule(None, rhs.instance, missing)))
+
+        for e in self.deleted:
+            if id(e) not in reused:
+                yield ("delete", e)
+        self.deleted.clear()
+        yield from changes
+
+    def _restore(self, change: Diff[EventSchedule]) -> Iterator[Diff[EventSchedule]]:
+        """Keep the dates outside the window on the existing event the `change` modifies."""
+        match change:
+            case ("delete", e) if (outside := self.outside.get(e.id())) is not None:
+                self.split.pop(e.id(), None)
+                yield ("update", (e, outside))
+            case ("update", (e, new)) if (outside := self.outside.get(e.id())) is not None:
+                if new.instance == outside.instance:
+                    yield ("update", (e, EventSchedule.combine(new, outside, eid=e.id())))
+                else:
+                    self.split[e.id()] = EventSchedule(None, new.instance, new.on_dates)
+                    yield ("update", (e, outside))
+            case _:
+                yield change
@@ -1,12 +1,17 @@
 import datetime
+import functools
+import operator
+import sys
+import weakref
 from collections.abc import Iterable
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Self
 
 from gregle import tz
-from gregle.lu.address import address as address_of_room
+from gregle.lu.address import directory as room_directory
 
 from ..event import Event
+from .dates import DateSet
 
 type Slot = tuple[datetime.time, datetime.timedelta]
 """Unique ID of a time slot within a week.
@@ -24,8 +29,23 @@ type GroupID = tuple[Slot, tuple[str, ...], tuple[str, ...], tuple[str, ...], st
 """
 
 
-@dataclass(frozen=True, unsafe_hash=True, slots=True)
+_INSTANCES: "weakref.WeakValueDictionary[EventInstance, EventInstance]" = weakref.WeakValueDictionary()
+
+
+@functools.lru_cache(maxsize=4096)
+def intern_strings(strings: tuple[str, ...]) -> tuple[str, ...]:
+    """Share a single copy of equal tuples of strings, and of the strings within them.
+
+    Only the most recently used tuples are shared, so a long running process does not keep every tuple it has seen."""
+    return tuple(map(sys.intern, strings))
+
+
+@dataclass(frozen=True, slots=True, weakref_slot=True)
 class EventInstance:
+    """The details of an event that are the same for every date it is on.
+
+    The strings are interned when the instance is created, and the group and hash are computed once."""
+
     module_codes: tuple[str, ...]
     module_name: str
     rooms: tuple[str, ...]
@@ -33,25 +53,59 @@ class EventInstance:
     content_type: str
     start: datetime.time
     duration: datetime.timedelta
+    _group: GroupID = field(init=False, repr=False, compare=False)
+    _hash: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # Frozen, so the fields are set through object
+        set_field = object.__setattr__
+        set_field(self, "module_codes", intern_strings(self.module_codes))
+        set_field(self, "module_name", sys.intern(self.module_name))
+        set_field(self, "rooms", intern_strings(self.rooms))
+        set_field(self, "lecturers", intern_strings(self.lecturers))
+        set_field(self, "content_type", sys.intern(self.content_type))
+        group = ((self.start, self.duration), self.module_codes, self.rooms, self.lecturers, self.content_type)
+        set_field(self, "_group", group)
+        set_field(self, "_hash", hash((group, self.module_name)))
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __reduce__(self) -> tuple[type[Self], tuple]:
+        # Rebuild through __init__ so unpickled instances are interned too
+        return (
+            type(self),
+            (
+                self.module_codes,
+                self.module_name,
+                self.rooms,
+                self.lecturers,
+                self.content_type,
+                self.start,
+                self.duration,
+            ),
+        )
+
+    def intern(self) -> "EventInstance":
+        """The shared instance equal to this one."""
+        return _INSTANCES.setdefault(self, self)
 
     def slot(self) -> Slot:
-        return (self.start, self.duration)
+        return self._group[0]
 
     def group(self) -> GroupID:
-        return (
-            self.slot(),
-            self.module_codes,
-            self.rooms,
-            self.lecturers,
-            self.content_type,
-        )
+        return self._group
 
 
 @dataclass(slots=True)
 class EventSchedule(Event):
     _id: str | None
     instance: EventInstance
-    on_dates: list[datetime.date]
+    on_dates: DateSet
+
+    def __post_init__(self) -> None:
+        if not isinstance(self.on_dates, DateSet):
+            self.on_dates = DateSet(self.on_dates)
 
     def id(self) -> str | None:
         return self._id
@@ -71,14 +125,9 @@ class EventSchedule(Event):
         )
 
     def address(self) -> str:
-        exception: KeyError | None = None
-        for room in self.instance.rooms:
-            try:
-                return address_of_room(room)
-            except KeyError as exc:
-                exception = exc
-                continue
-        raise KeyError("No address found for any room") from exception
+        if (address := room_directory().resolve(self.instance.rooms)) is None:
+            raise KeyError("No address found for any room")
+        return address
 
     def time_start(self) -> datetime.datetime:
         return datetime.datetime.combine(self.on_dates[0], self.instance.start, tz.DEFAULT)
@@ -89,6 +138,16 @@ class EventSchedule(Event):
     def occurrences(self) -> Iterable[datetime.date]:
         return self.on_dates[1:]
 
+    def group(self) -> GroupID:
+        return self.instance.group()
+
+    def clip(self, start: datetime.date, end: datetime.date) -> Self | None:
+        """The event on only its dates in [start, end), `None` if it has none."""
+        on_dates = self.on_dates.between(start, end)
+        if not on_dates:
+            return None
+        return type(self)(self.id(), self.instance, on_dates)
+
     @classmethod
     def from_event(cls, other: Event) -> Self:
         data = other.description().strip().split("\n")
@@ -103,9 +162,9 @@ class EventSchedule(Event):
             content_type,
             start.time(),
             other.time_delta(),
-        )
+        ).intern()
 
-        return cls(other.id(), event, [start.date()] + list(other.occurrences()))
+        return cls(other.id(), event, DateSet((start.date(), *other.occurrences())))
 
     @classmethod
     def combine(cls, event: Self, *rest: Self, eid: str | None = None) -> Self:
@@ -120,7 +179,7 @@ class EventSchedule(Event):
             New event with the same group as the input events and all their dates."""
 
         assert all(e.instance.group() == event.instance.group() for e in rest), "Events do not share the same group"
-        on_dates = sorted({date for e in (event, *rest) for date in e.on_dates})
+        on_dates = functools.reduce(operator.or_, (e.on_dates for e in rest), event.on_dates)
         return cls(
             eid,
             event.instance,
@@ -0,0 +1,232 @@
+import bisect
+import datetime
+from array import array
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+
+from .. import tz
+from .event import EventInstance, EventSchedule
+from .store import EventStore
+
+DAY = 86400
+"""Seconds in a day, occurrences are keyed by `date ordinal * DAY + seconds since midnight`."""
+
+type When = datetime.date | datetime.datetime
+"""A point in time, a date is its midnight and an aware datetime is converted to the default timezone."""
+
+
+@dataclass(frozen=True, slots=True)
+class Occurrence:
+    """A single date of an event.
+
+    Attributes:
+        event: The index of the event in the store.
+        instance: The details of the event.
+        start: When the occurrence starts, in the default timezone.
+        end: When the occurrence ends."""
+
+    event: int
+    instance: EventInstance
+    start: datetime.datetime
+    end: datetime.datetime
+
+
+class _Timeline:
+    """Occurrences sorted by their start, for finding those that overlap a range.
+
+    As no occurrence is longer than `longest`, only the occurrences starting in the `longest` seconds before a range
+    can overlap it without starting in it. Each lookup is a binary search and a scan of those candidates."""
+
+    __slots__ = ("ends", "ids", "longest", "starts")
+
+    def __init__(self) -> None:
+        self.starts = array("q")
+        self.ends = array("q")
+        self.ids = array("I")
+        self.longest = 0
+
+    def append(self, oid: int, start: int, end: int) -> None:
+        """Add an occurrence, which must not start before the last occurrence added."""
+        self.starts.append(start)
+        self.ends.append(end)
+        self.ids.append(oid)
+        self.longest = max(self.longest, end - start)
+
+    def overlapping(self, lo: int, hi: int) -> Iterator[int]:
+        """The ids of the occurrences overlapping [lo, hi), ordered by their start."""
+        starts, ends, ids = self.starts, self.ends, self.ids
+        first = bisect.bisect_right(starts, lo - self.longest)
+        last = bisect.bisect_left(starts, hi, first)
+        return (ids[i] for i in range(first, last) if ends[i] > lo)
+
+    def clashes(self) -> Iterator[tuple[int, int]]:
+        """The ids of each pair of overlapping occurrences, the first starting no later than the second."""
+        starts, ends, ids = self.starts, self.ends, self.ids
+        for i, end in enumerate(ends):
+            j = i + 1
+            while j < len(starts) and starts[j] < end:
+                yield (ids[i], ids[j])
+                j += 1
+
+
+class EventIndex:
+    """Events indexed by when they occur and by their module codes, rooms and lecturers.
+
+    The events are kept in an `EventStore`. Each date of an event is an occurrence, which is placed on a timeline
+    of every occurrence and on the timeline of each of its module codes, rooms and lecturers.
+    Equal instances occurring at the same time are a single occurrence, so the timetables of many students
+    can be indexed together without their shared events clashing with themselves.
+
+    Lookups by time are a binary search over a timeline, rather than a scan of every date of every event."""
+
+    def __init__(self, events: Iterable[EventSchedule] = ()) -> None:
+        self.store = EventStore.from_events(events)
+        self.timeline = _Timeline()
+        """Every occurrence."""
+        self.modules: dict[str, _Timeline] = {}
+        self.rooms: dict[str, _Timeline] = {}
+        self.lecturers: dict[str, _Timeline] = {}
+        self.events_of: dict[str, dict[str, list[int]]] = {"module": {}, "room": {}, "lecturer": {}}
+        """The indices of the events with each module code, room and lecturer."""
+        self._owner = array("I")
+        """Index of the event of each occurrence."""
+        self._build()
+
+    def _build(self) -> None:
+        store = self.store
+        keys: dict[tuple[int, int], tuple[int, int]] = {}
+        for index in range(len(store)):
+            iid = store.instance[index]
+            instance = store.instances[iid]
+            start = _seconds_of(instance.start)
+            duration = int(instance.duration.total_seconds())
+            for field, values in (
+                ("module", instance.module_codes),
+                ("room", instance.rooms),
+                ("lecturer", instance.lecturers),
+            ):
+                for value in values:
+                    self.events_of[field].setdefault(value, []).append(index)
+            for ordinal in store.dates[store.offsets[index] : store.offsets[index + 1]]:
+                keys.setdefault((ordinal * DAY + start, iid), (index, duration))
+
+        modules: dict[str, _Timeline] = defaultdict(_Timeline)
+        rooms: dict[str, _Timeline] = defaultdict(_Timeline)
+        lecturers: dict[str, _Timeline] = defaultdict(_Timeline)
+        for oid, ((start, iid), (index, duration)) in enumerate(sorted(keys.items())):
+            end = start + duration
+            instance = store.instances[iid]
+            self._owner.append(index)
+            self.timeline.append(oid, start, end)
+            for code in instance.module_codes:
+                modules[code].append(oid, start, end)
+            for room in instance.rooms:
+                rooms[room].append(oid, start, end)
+            for lecturer in instance.lecturers:
+                lecturers[lecturer].append(oid, start, end)
+        self.modules, self.rooms, self.lecturers = dict(modules), dict(rooms), dict(lecturers)
+
+    def __len__(self) -> int:
+        """The number of occurrences."""
+        return len(self._owner)
+
+    def occurrence(self, oid: int) -> Occurrence:
+        index = self._owner[oid]
+        start = self.timeline.starts[oid]
+        instance = self.store.instances[self.store.instance[index]]
+        begin = datetime.datetime.combine(datetime.date.fromordinal(start // DAY), instance.start, tz.DEFAULT)
+        return Occurrence(index, instance, begin, begin + instance.duration)
+
+    def _timeline(
+        self, module: str | None, room: str | None, lecturer: str | None
+    ) -> tuple[_Timeline, list[tuple[int, str]]]:
+        """The shortest timeline of the filters, and the checks of the other filters as (field, key) pairs.
+
+        The fields are the positions of module codes, rooms and lecturers in `_matches`."""
+        timelines: list[tuple[_Timeline, int, str]] = []
+        by_field = (self.modules, self.rooms, self.lecturers)
+        for field, key in enumerate((module, room, lecturer)):
+            if key is not None:
+                timelines.append((by_field[field].get(key, _EMPTY), field, key))
+        if not timelines:
+            return self.timeline, []
+        timelines.sort(key=lambda t: len(t[0].starts))
+        (timeline, _, _), *rest = timelines
+        return timeline, [(field, key) for _, field, key in rest]
+
+    @staticmethod
+    def _matches(instance: EventInstance, checks: list[tuple[int, str]]) -> bool:
+        fields = (instance.module_codes, instance.rooms, instance.lecturers)
+        return all(key in fields[field] for field, key in checks)
+
+    def between(
+        self, start: When, end: When, *, module: str | None = None, room: str | None = None, lecturer: str | None = None
+    ) -> list[Occurrence]:
+        """The occurrences overlapping [start, end), ordered by their start.
+
+        Args:
+            start: Start of the range.
+            end: End of the range, a date is its midnight so the range does not include that date.
+            module: Only occurrences of this module code.
+            room: Only occurrences in this room.
+            lecturer: Only occurrences with this lecturer."""
+        timeline, checks = self._timeline(module, room, lecturer)
+        occurrences = map(self.occurrence, timeline.overlapping(_key(start), _key(end)))
+        return [o for o in occurrences if self._matches(o.instance, checks)]
+
+    def at(
+        self, when: When, *, module: str | None = None, room: str | None = None, lecturer: str | None = None
+    ) -> list[Occurrence]:
+        """The occurrences in progress at `when`, such as who is in a `room` at that time."""
+        timeline, checks = self._timeline(module, room, lecturer)
+        key = _key(when)
+        occurrences = map(self.occurrence, timeline.overlapping(key, key + 1))
+        return [o for o in occurrences if self._matches(o.instance, checks)]
+
+    def clashes(
+        self, *, module: str | None = None, room: str | None = None, lecturer: str | None = None
+    ) -> Iterator[tuple[Occurrence, Occurrence]]:
+        """Each pair of overlapping occurrences, the first starting no later than the second.
+
+        With a `room`, these are the times it is double booked. Only the overlapping pairs are visited,
+        so finding them takes time in proportion to the occurrences and the clashes, not every pair."""
+        timeline, checks = self._timeline(module, room, lecturer)
+        for a, b in timeline.clashes():
+            lhs, rhs = self.occurrence(a), self.occurrence(b)
+            if self._matches(lhs.instance, checks) and self._matches(rhs.instance, checks):
+                yield (lhs, rhs)
+
+    def events(
+        self, *, module: str | None = None, room: str | None = None, lecturer: str | None = None
+    ) -> list[EventSchedule]:
+        """The events with all of the given module code, room and lecturer, in the order they were indexed."""
+        candidates: set[int] | None = None
+        for field, key in (("module", module), ("room", room), ("lecturer", lecturer)):
+            if key is not None:
+                found = set(self.events_of[field].get(key, ()))
+                candidates = found if candidates is None else candidates & found
+        indices = range(len(self.store)) if candidates is None else sorted(candidates)
+        return [self.store[index] for index in indices]
+
+    def span(self) -> tuple[datetime.date, datetime.date] | None:
+        """The dates of the first and last occurrences, in the format (start, end] of `datespan`."""
+        if not len(self):
+            return None
+        first, last = self.timeline.starts[0] // DAY, self.timeline.starts[-1] // DAY
+        return datetime.date.fromordinal(first), datetime.date.fromordinal(last) + datetime.timedelta(days=1)
+
+
+_EMPTY = _Timeline()
+
+
+def _seconds_of(time: datetime.time) -> int:
+    return time.hour * 3600 + time.minute * 60 + time.second
+
+
+def _key(when: When) -> int:
+    if isinstance(when, datetime.datetime):
+        if when.tzinfo is not None:
+            when = when.astimezone(tz.DEFAULT)
+        return when.toordinal() * DAY + _seconds_of(when.time())
+    return when.toordinal() * DAY
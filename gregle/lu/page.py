@@ -0,0 +1,179 @@
+import hashlib
+import re
+from collections.abc import Iterator
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Self
+
+from ..log import log
+from .event import EventSchedule
+from .timetable import Node, events_from_table, week_map
+
+VOID_ELEMENTS = frozenset(
+    {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+)
+IMPLIED_END = {
+    "option": frozenset({"option"}),
+    "tr": frozenset({"tr", "td", "th"}),
+    "td": frozenset({"td", "th"}),
+    "th": frozenset({"td", "th"}),
+}
+"""Open elements that are implicitly closed by the start of another element"""
+HIDDEN_ELEMENTS = frozenset({"script", "style", "template", "head", "title"})
+RE_WHITESPACE = re.compile(r"[ \t\n\r\f]+")
+RE_VOLATILE = re.compile(r"<script\b.*?</script>|<input\b[^>]*\btype=\"hidden\"[^>]*>", re.DOTALL | re.IGNORECASE)
+"""Parts of a page that change each time it is loaded, such as session tokens, without changing the timetable"""
+
+
+class Element(Node):
+    """A `Node` parsed from static HTML source."""
+
+    def __init__(self, tag: str, attrs: dict[str, str], parent: "Element | None", src: str, start: int) -> None:
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.content: list[Element | str] = []
+        self._src = src
+        self._start = start
+        self._end = start
+
+    @property
+    def classes(self) -> list[str]:
+        return self.attrs.get("class", "").split()
+
+    def elements(self) -> list["Element"]:
+        return [c for c in self.content if isinstance(c, Element)]
+
+    def iter(self) -> Iterator["Element"]:
+        """Iterate over all descendants in document order."""
+        stack = self.elements()[::-1]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.elements()[::-1])
+
+    def by_id(self, eid: str) -> "Element | None":
+        return next((e for e in self.iter() if e.attrs.get("id") == eid), None)
+
+    def attribute(self, name: str) -> str | None:
+        return self.attrs.get(name)
+
+    def text(self) -> str:
+        """Approximate `innerText`, collapsing whitespace and keeping line breaks."""
+        parts: list[str] = []
+        stack: list[Element | str] = self.content[::-1]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(RE_WHITESPACE.sub(" ", node))
+            elif node.tag == "br":
+                parts.append("\n")
+            elif node.tag not in HIDDEN_ELEMENTS:
+                stack.extend(node.content[::-1])
+        lines = (line.strip(" ") for line in "".join(parts).split("\n"))
+        return "\n".join(lines).strip("\n")
+
+    def html(self) -> str:
+        return self._src[self._start : self._end]
+
+    def find(self, class_name: str) -> Self | None:
+        return next((e for e in self.iter() if class_name in e.classes), None)  # type: ignore[return-value]
+
+    def find_all(self, class_name: str) -> list[Self]:
+        return [e for e in self.iter() if class_name in e.classes]  # type: ignore[misc]
+
+    def children(self, tag: str) -> list[Self]:
+        return [e for e in self.elements() if e.tag == tag]  # type: ignore[misc]
+
+    def describe(self) -> str:
+        eid = f"#{eid}" if (eid := self.attrs.get("id")) else ""
+        classes = f".{".".join(classes)}" if (classes := self.classes) else ""
+        return f"{self.tag}{eid}{classes}"
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self, src: str) -> None:
+        super().__init__(convert_charrefs=True)
+        self.src = src
+        self.root = Element("#document", {}, None, src, 0)
+        self.stack = [self.root]
+        self.lines = [0, *(m.end() for m in re.finditer("\n", src))]
+
+    def position(self) -> int:
+        line, col = self.getpos()
+        return self.lines[line - 1] + col
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        start = self.position()
+        end = start + len(self.get_starttag_text() or "")
+        while (closes := IMPLIED_END.get(tag)) and self.stack[-1].tag in closes:
+            self.stack.pop()._end = start  # noqa: SLF001
+        parent = self.stack[-1]
+        element = Element(tag, {k: v or "" for k, v in attrs}, parent, self.src, end)
+        parent.content.append(element)
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(element)
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        end = self.position() + len(self.get_starttag_text() or "")
+        parent = self.stack[-1]
+        parent.content.append(Element(tag, {k: v or "" for k, v in attrs}, parent, self.src, end))
+
+    def handle_endtag(self, tag: str) -> None:
+        # Close any unclosed elements up to the matching start tag, ignoring stray end tags
+        if not any(e.tag == tag for e in self.stack[1:]):
+            return
+        end = self.position()
+        while (element := self.stack.pop()).tag != tag:
+            element._end = end  # noqa: SLF001
+        element._end = end  # noqa: SLF001
+
+    def handle_data(self, data: str) -> None:
+        self.stack[-1].content.append(data)
+
+
+def parse(src: str) -> Element:
+    """Parse an HTML document into a tree of `Element`s."""
+    builder = _TreeBuilder(src)
+    builder.feed(src)
+    builder.close()
+    return builder.root
+
+
+def digest(src: str) -> str:
+    """A hash of the content of a page, which only changes when the content of the timetable could have changed."""
+    return hashlib.sha256(RE_WHITESPACE.sub(" ", RE_VOLATILE.sub("", src)).encode()).hexdigest()
+
+
+def events_from_source(src: str, semester: int) -> list[EventSchedule]:
+    """Extract events from the HTML source of a saved timetable page.
+
+    This produces the same events as loading the page into a browser, without needing one.
+
+    Args:
+        src: The HTML source of the timetable page.
+        semester: The ID of the semester the timetable is for.
+
+    Returns:
+        A list of `EventSchedule` instances representing the events in the timetable."""
+    document = parse(src)
+    selector = document.by_id("P2_MY_PERIOD")
+    if selector is None:
+        raise ValueError(f"Semester {semester} page has no week selector")
+    weeks = week_map(option.text() for option in selector.iter() if option.tag == "option")
+
+    log.info("Parsing LU Semester: %s", semester)
+
+    table = document.by_id("timetable_details")
+    if table is None:
+        raise ValueError(f"Semester {semester} page has no timetable")
+    events = events_from_table(table, weeks)
+
+    log.info("LU Semester found %d LU events over %d dates", len(events), sum(len(e.on_dates) for e in events))
+
+    return events
+
+
+def events_from_file(semester: int, filename: Path) -> list[EventSchedule]:
+    """Extract events from a saved timetable page, see `events_from_source`."""
+    return events_from_source(filename.read_text(), semester)
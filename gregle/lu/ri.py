@@ -1,58 +1,76 @@
 import base64
 import contextlib
 import datetime
-import re
+import hashlib
 import time
 from collections.abc import Generator, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Self
-
-import selenium
-import selenium.common
-import selenium.webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.remote.webelement import WebElement
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.select import Select
-from selenium.webdriver.support.wait import WebDriverWait
-
-from .. import cache, tz
+from typing import TYPE_CHECKING, Literal, Self
+
+from .. import cache
 from .. import path as PATH
 from ..log import log
-from .event import EventInstance, EventSchedule, GroupID
+from ..metrics import metrics
+from . import page, session
+from .event import EventSchedule
+from .store import EventStore
+from .timetable import DataNode, Node, WeekMap, events_from_table, parse_week, week_map
+
+if TYPE_CHECKING:
+    # selenium is slow to import, and only needed to scrape the live timetable
+    import selenium.webdriver
+    from selenium.webdriver.remote.webelement import WebElement
+    from selenium.webdriver.support.select import Select
 
 type WebDriver = selenium.webdriver.Chrome
-
-RE_WEEK = re.compile(r"Sem\s*(\d+)\s*-\s*Wk\s*(\d+)\s*\(starting\s*(\d{2}-\w{3}-\d{4})\)", re.I)
-"""Regex to match a week name in the timetable's selector dropdown
-
-- Semester ID
-- Week ID
-- Week Start Date"""
-
-type SemWk = tuple[int, int]
-"""Semester and Week ID"""
-type SemWks = set[SemWk]
-"""Set of weeks that an event repeats on"""
+type Backend = Literal["html", "selenium"]
+"""How cached timetable pages are parsed
+
+- html: Parse the HTML directly
+- selenium: Load the page into a headless browser"""
+
+
+EXTRACT_SEMESTER_JS = """
+const CONTENT = ["tt_module_id_row", "tt_module_name_row", "tt_lect_row", "tt_room_row", "tt_modtype_row", "tt_weeks_row"];
+const cell = (td) => {
+    const find = {};
+    if (td.className.includes("tt_info_cell")) {
+        for (const name of CONTENT) {
+            const node = td.getElementsByClassName(name)[0];
+            if (node !== undefined) find[name] = { text: node.innerText };
+        }
+    }
+    return {
+        attrs: { class: td.className, colspan: String(td.colSpan), rowspan: String(td.rowSpan) },
+        html: td.className.includes("weekday_col") ? td.innerHTML : "",
+        find: find,
+    };
+};
+const table = document.getElementById("timetable_details");
+const rows = Array.from(table.getElementsByClassName("tt_info_row"), (row) => ({
+    children: { td: Array.from(row.querySelectorAll(":scope > td"), cell) },
+}));
+const weeks = Array.from(document.getElementById("P2_MY_PERIOD").options, (option) => option.innerText);
+return { weeks: weeks, table: { find_all: { tt_info_row: rows } } };
+"""
+"""Script to describe the timetable page in a single WebDriver call, for use with `DataNode`"""
 
 
 @dataclass
 class Week:
-    element: WebElement
+    element: "WebElement"
     semester: int
     wk: int
     date: datetime.date
 
 
-type WeekMap = dict[SemWk, Week]
-
-
 @dataclass
 class PageSelector:
-    selector: Select
+    selector: "Select"
     weeks: list[Week]
-    semesters: dict[int, WebElement]
+    semesters: "dict[int, WebElement]"
 
     @property
     def current(self) -> Week:
@@ -64,27 +82,29 @@ class PageSelector:
 
     @classmethod
     def from_driver(cls, driver: WebDriver) -> Self:
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.select import Select
+
         selector = Select(driver.find_element(By.ID, "P2_MY_PERIOD"))
 
         weeks: list[Week] = []
         semesters: dict[int, WebElement] = {}
         for item in selector.options:
             name = (item.get_attribute("innerText") or "").lower()
-            if (m := RE_WEEK.match(name)) is not None:
-                date = datetime.datetime.strptime(m[3], "%d-%b-%Y").date()  # noqa: DTZ007
-                weeks.append(Week(item, int(m[1]), int(m[2]), date))
+            if (week := parse_week(name)) is not None:
+                weeks.append(Week(item, *week))
             elif name.startswith("semester"):
                 semesters[int(name.split()[-1])] = item
         return cls(selector, weeks, semesters)
 
-    def set(self, opt: Week | WebElement) -> None:
-        self.selector._set_selected(opt if isinstance(opt, WebElement) else opt.element)  # noqa: SLF001
+    def set(self, opt: "Week | WebElement") -> None:
+        self.selector._set_selected(opt.element if isinstance(opt, Week) else opt)  # noqa: SLF001
 
     def map(self) -> WeekMap:
-        return {(week.semester, week.wk): week for week in self.weeks}
+        return {(week.semester, week.wk): week.date for week in self.weeks}
 
 
-def fmt_element(node: WebElement) -> str:
+def fmt_element(node: "WebElement") -> str:
     eid = node.get_attribute("id")
     if eid:
         eid = f"#{eid}"
@@ -94,146 +114,66 @@ def fmt_element(node: WebElement) -> str:
     return f"{node.tag_name}{eid}{classes}"
 
 
-def extract_repeated_weeks(weeks: str) -> Iterator[SemWk]:
-    """Extract the weeks that an event repeats on from the timetable."""
-    PREFIX = "weeks:"
-    weeks = weeks.lstrip(PREFIX).lstrip()
-    for sem_data in weeks.split("sem"):
-        sem_data = sem_data.strip()
-        if not sem_data:
-            continue
-        sem_name, weeks = map(str.strip, sem_data.split(":"))
-        sem = int(sem_name)
-        for rng in weeks.split(","):
-            rng = rng.strip()
-            if "-" in rng:
-                lhs, rhs = (int(s.strip()) for s in rng.split("-"))
-                yield from ((sem, wk) for wk in range(lhs, rhs + 1))
-            else:
-                yield (sem, int(rng))
-
-
-def event_from_node(node: WebElement, start: datetime.datetime, weeks: WeekMap) -> EventSchedule:
-    """Extract an event from a node in the timetable.
+class WebNode(Node):
+    """A `Node` backed by a live `WebElement`."""
 
-    Args:
-        node: The `WebElement` node representing the event.
-        start: The `datetime` of the start of the event.
-        weeks: A mapping of the weeks in the timetable to dates.
+    def __init__(self, element: "WebElement") -> None:
+        self.element = element
 
-    Returns:
-        An `EventSchedule` instance representing the event."""
+    def attribute(self, name: str) -> str | None:
+        return self.element.get_attribute(name)
+
+    def text(self) -> str:
+        return self.element.get_attribute("innerText") or ""
+
+    def html(self) -> str:
+        return self.element.get_attribute("innerHTML") or ""
+
+    def find(self, class_name: str) -> Self | None:
+        from selenium.common import NoSuchElementException
+        from selenium.webdriver.common.by import By
 
-    def get_content_of(class_name: str) -> str | None:
         try:
-            return node.find_element(By.CLASS_NAME, class_name).get_attribute("innerText")
-        except selenium.common.NoSuchElementException:
-            log.exception("Failed to find element '.%s' on node %s", class_name, fmt_element(node), stack_info=True)
+            return type(self)(self.element.find_element(By.CLASS_NAME, class_name))
+        except NoSuchElementException:
             return None
 
-    def remove_ellipsis(string: str) -> str:
-        if string.endswith("..."):
-            string = string[: -len("...")]
-        return string
-
-    def split(string: str) -> tuple[str, ...]:
-        s = {ss for s in remove_ellipsis(string).split(",") if (ss := s.strip())}
-        return tuple(sorted(s - {"..."}))
-
-    duration = int(node.get_attribute("colspan") or "") // 2  # hours
-    module_codes = split(get_content_of("tt_module_id_row") or "")
-    module_name = remove_ellipsis(get_content_of("tt_module_name_row") or "")
-    lecturers = split(get_content_of("tt_lect_row") or "")
-    rooms = split(get_content_of("tt_room_row") or "")
-    content_type = get_content_of("tt_modtype_row")
-
-    event = EventInstance(
-        module_codes,
-        module_name or "",
-        rooms,
-        lecturers,
-        content_type or "",
-        start.time(),
-        datetime.timedelta(hours=duration),
-    )
-    instances = extract_repeated_weeks((get_content_of("tt_weeks_row") or "").lower())
-
-    return EventSchedule(
-        None, event, [weeks[semwk].date + datetime.timedelta(days=start.weekday()) for semwk in sorted(instances)]
-    )
-
-
-def events_from_weekday(
-    nodes: list[WebElement],
-    weekday: int,
-    weeks: WeekMap,
-) -> list[EventSchedule]:
-    """Extract events from a weekday in the timetable.
+    def find_all(self, class_name: str) -> list[Self]:
+        from selenium.webdriver.common.by import By
 
-    Args:
-        nodes: The list of `WebElement` nodes representing columns in the timetable for a single weekday.
-        weekday: The index of the weekday in the timetable. 0 is Monday.
-        weeks: A mapping of the weeks in the timetable to dates.
+        return [type(self)(e) for e in self.element.find_elements(By.CLASS_NAME, class_name)]
 
-    Returns:
-        A list of `EventSchedule` instances representing the events on the weekday."""
-    events: list[EventSchedule] = []
+    def children(self, tag: str) -> list[Self]:
+        from selenium.webdriver.common.by import By
 
-    loc = -1  # Offset -1 as we pre increment
-    for node in nodes:
-        loc += 1
-        if "tt_info_cell" not in (node.get_attribute("class") or ""):
-            continue
-        dt = datetime.timedelta(days=weekday, hours=loc / 2)
-        # 2000-01-03 is a Monday, so we can add the weekday to get the correct day
-        day = datetime.datetime.combine(datetime.date(2000, 1, 3), datetime.time(hour=9), tz.DEFAULT)
-        event = event_from_node(node, day + dt, weeks)
-        loc += (event.instance.duration.total_seconds() / 60 / 60) * 2 - 1
-        events.append(event)
+        return [type(self)(e) for e in self.element.find_elements(By.CSS_SELECTOR, f":scope > {tag}")]
 
-    return events
+    def describe(self) -> str:
+        return fmt_element(self.element)
 
 
-def events_from_semester(driver: WebDriver, semester: int) -> list[EventSchedule]:
+def events_from_semester(driver: WebDriver, semester: int, *, bulk: bool = True) -> list[EventSchedule]:
     """Extract events from the timetable the `driver` is currently on.
 
     Args:
         driver: The `WebDriver` pointing to the timetable.
         semester: The ID of the semester the timetable is for.
+        bulk: Extract the whole page in a single script call, instead of querying each element.
 
     Returns:
         A list of `EventSchedule` instances representing the events in the timetable."""
-    pages = PageSelector.from_driver(driver)
-    weeks = pages.map()
-
     log.info("Parsing LU Semester: %s", semester)
 
-    events: list[EventSchedule] = []
-    table = driver.find_element(By.ID, "timetable_details")
-    weekday = -1
-    with wait_timeout(driver, 0):
-        weekdays = iter(table.find_elements(By.CLASS_NAME, "tt_info_row"))
-        for row in weekdays:
-            nodes = row.find_elements(By.CSS_SELECTOR, ":scope > td")
-
-            if "weekday_col" not in (nodes[0].get_attribute("class") or ""):
-                continue
-            if "on demand" in (nodes[0].get_attribute("innerHTML") or "").lower():
-                continue
-            weekday += 1
-
-            # The number of rows this weekday spans
-            rows = int(nodes[0].get_attribute("rowspan") or "")
-
-            events.extend(events_from_weekday(nodes[1:], weekday, weeks))
-            for _ in range(rows - 1):
-                events.extend(
-                    events_from_weekday(
-                        next(weekdays).find_elements(By.CSS_SELECTOR, ":scope > td"),
-                        weekday,
-                        weeks,
-                    )
-                )
+    if bulk:
+        data = driver.execute_script(EXTRACT_SEMESTER_JS)
+        events = events_from_table(DataNode(data["table"]), week_map(data["weeks"]))
+    else:
+        from selenium.webdriver.common.by import By
+
+        weeks = PageSelector.from_driver(driver).map()
+        table = WebNode(driver.find_element(By.ID, "timetable_details"))
+        with wait_timeout(driver, 0):
+            events = events_from_table(table, weeks)
 
     log.info("LU Semester found %d LU events over %d dates", len(events), sum(len(e.on_dates) for e in events))
 
@@ -242,6 +182,8 @@ def events_from_semester(driver: WebDriver, semester: int) -> list[EventSchedule
 
 def driver_build(headless: bool) -> WebDriver:
     """Build a new `WebDriver` instance."""
+    import selenium.webdriver
+
     opt = selenium.webdriver.ChromeOptions()
     if headless:
         opt.add_argument("--headless")
@@ -269,12 +211,16 @@ def navigate_to_timetable(driver: WebDriver, *, headless: bool) -> WebDriver:
     """Navigate the `driver` to the live timetable page.
 
     The `driver` will wait for the user to sign in if `headless` is `False`."""
-    URL = "https://lucas.lboro.ac.uk/its_apx/f?p=student_timetable"
+    URL = session.URL
     log.info("Navigating to live timetable: %s", URL)
     driver.get(URL)
     if headless:
         _navigate_to_timetable_auto(driver)
     else:
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.wait import WebDriverWait
+
         EXPECTED = "https://lucas.lboro.ac.uk/its_apx/f"
         WebDriverWait(driver, 120, poll_frequency=1).until(
             EC.all_of(
@@ -310,10 +256,12 @@ def iter_semesters(cache_dir: Path, use_cache: bool) -> Iterator[tuple[WebDriver
         An iterator of tuples containing the `WebDriver` and the semester ID.
         The order is not guaranteed."""
     f_cache_info = cache_dir / "meta.cache"
-    if not use_cache or cache.stale(f_cache_info, datetime.timedelta(hours=1)):
+    if not use_cache or cached_stale(cache_dir):
         log.info("Loading timetable from server...")
         driver = driver_build(False)
         navigate_to_timetable(driver, headless=False)
+        # Later runs can fetch the pages without signing in again, until the session expires
+        session.Session.from_driver(driver).save(session.filepath(cache_dir))
         cache_dir.mkdir(exist_ok=True, parents=True)
         pages = PageSelector.from_driver(driver)
         for semester, element in pages.semesters.items():
@@ -325,14 +273,101 @@ def iter_semesters(cache_dir: Path, use_cache: bool) -> Iterator[tuple[WebDriver
     else:
         log.info("Loading timetable from cache...")
         driver = driver_build(True)
-        for filename in cache_dir.glob("*.html"):
-            yield (navigate_to_src(driver, filename.read_text()), int(filename.stem))
+        for semester, src in iter_cached(cache_dir):
+            yield (navigate_to_src(driver, src), semester)
+
+
+def fetch_pages(cache_dir: Path) -> bool:
+    """Save the semester pages to `cache_dir` over HTTP, with the session saved by the last browser sign in.
+
+    Returns:
+        Whether the pages were saved, `False` if there is no saved session or it could not be used."""
+    filepath = session.filepath(cache_dir)
+    if (saved := session.Session.load(filepath)) is None:
+        return False
+    try:
+        session.fetch_semesters(saved, cache_dir)
+    except session.FetchError as exc:
+        log.warning("Could not fetch timetable with the saved session: %s", exc)
+        if isinstance(exc, session.SessionExpired):
+            filepath.unlink(missing_ok=True)
+        return False
+    saved.save(filepath)
+    return True
 
 
-def get_events(use_cache: bool) -> list[EventSchedule]:
+def cached_stale(cache_dir: Path) -> bool:
+    """Whether the timetable cached in `cache_dir` is missing or older than 1 hour."""
+    return cache.stale(cache_dir / "meta.cache", datetime.timedelta(hours=1))
+
+
+def cached_pages(cache_dir: Path) -> list[tuple[int, Path]]:
+    """The semester pages cached in `cache_dir`, ordered by semester ID."""
+    return sorted((int(filename.stem), filename) for filename in cache_dir.glob("*.html"))
+
+
+def page_digests(cache_dir: Path) -> dict[str, str]:
+    """The `page.digest` of each semester page cached in `cache_dir`, by semester ID."""
+    return {str(semester): page.digest(filename.read_text()) for semester, filename in cached_pages(cache_dir)}
+
+
+def iter_cached(cache_dir: Path) -> Iterator[tuple[int, str]]:
+    """Iterate over the semester pages cached in `cache_dir`.
+
+    Returns:
+        An iterator of tuples containing the semester ID and the HTML source of its page."""
+    for semester, filename in cached_pages(cache_dir):
+        yield (semester, filename.read_text())
+
+
+def events_from_cache(cache_dir: Path, workers: int = 0) -> list[EventSchedule]:
+    """Parse the semester pages cached in `cache_dir` with the html backend.
+
+    Args:
+        cache_dir: The directory containing the cached pages.
+        workers: Parse the pages on this many processes.
+
+    Returns:
+        The events of every semester, in semester order."""
+    semesters, files = zip(*pages) if (pages := cached_pages(cache_dir)) else ((), ())
+    if workers > 1 and len(pages) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pages))) as pool:
+            results = list(pool.map(page.events_from_file, semesters, files))
+    else:
+        results = list(map(page.events_from_file, semesters, files))
+    return [event for result in results for event in result]
+
+
+def get_events(
+    use_cache: bool, backend: Backend = "html", *, bulk: bool = True, workers: int = 0, browser: bool = False
+) -> list[EventSchedule]:
+    """Load the events from every semester of the timetable.
+
+    Stale pages are fetched over HTTP with the saved session, falling back to signing in with a browser.
+
+    Args:
+        use_cache: Use the cached timetable pages if they are fresh.
+        backend: How cached pages are parsed.
+        bulk: Extract live pages in a single script call.
+        workers: Parse cached pages on this many processes, when using the html backend.
+        browser: Always sign in with a browser, instead of using the saved session.
+
+    Returns:
+        The events of every semester, in semester order."""
+    cache_dir = PATH.CACHE / "semester"
+    fresh = use_cache and not cached_stale(cache_dir)
+    metrics.count("gregle_cache_hits_total" if fresh else "gregle_cache_misses_total", cache="semester")
+    if not fresh and not browser:
+        with metrics.stage("scrape"):
+            fresh = fetch_pages(cache_dir)
+    if backend == "html" and fresh:
+        log.info("Loading timetable from cache...")
+        with metrics.stage("parse"):
+            return events_from_cache(cache_dir, workers)
     events: list[EventSchedule] = []
-    for driver, semester in iter_semesters(PATH.CACHE / "semester", use_cache):
-        events.extend(events_from_semester(driver, semester))
+    with metrics.stage("scrape"):
+        for driver, semester in iter_semesters(cache_dir, fresh):
+            events.extend(events_from_semester(driver, semester, bulk=bulk))
     return events
 
 
@@ -344,19 +379,24 @@ def dedupe_events(events: Iterable[EventSchedule]) -> list[EventSchedule]:
     Returns:
         A list of deduplicated events. The order of the events is not guaranteed.
         The ID of the events WILL NOT be preserved."""
-    tbl: dict[GroupID, tuple[EventInstance, set[datetime.date]]] = {}
+    return list(EventStore.merged(events))
+
+
+def events_digest(events: Iterable[EventSchedule]) -> str:
+    """A hash of the `events`, which does not depend on their order."""
+    return hashlib.sha256("\n".join(sorted(map(repr, events))).encode()).hexdigest()
+
 
-    for event in events:
-        group = event.instance.group()
-        if group in tbl:
-            tbl[group][1].update(event.on_dates)
-        else:
-            tbl[group] = (event.instance, set(event.on_dates))
+def _events_key(
+    html_cache: bool, backend: Backend = "html", workers: int = 0, browser: bool = False
+) -> tuple[bool, Backend]:
+    return (html_cache, backend)
 
-    return [EventSchedule(None, instance, sorted(dates)) for instance, dates in tbl.values()]
 
+@cache.file(PATH.CACHE / "events.pkl", datetime.timedelta(minutes=60), key=_events_key, schema=4)
+def events(html_cache: bool, backend: Backend = "html", workers: int = 0, browser: bool = False) -> EventStore:
+    """The deduplicated events of the timetable, as in `dedupe_events`.
 
-@cache.file(PATH.CACHE / "events.pkl", datetime.timedelta(minutes=60))
-def events(html_cache: bool) -> list[EventSchedule]:
-    es = get_events(html_cache)
-    return dedupe_events(es)
+    They are kept in an `EventStore`, both in memory and in the cache file, and are materialised when iterated."""
+    es = get_events(html_cache, backend, workers=workers, browser=browser)
+    return EventStore.merged(es).compact()
@@ -0,0 +1,214 @@
+import datetime
+import http.cookiejar
+import itertools
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Self
+
+from ..log import log
+from . import page
+
+if TYPE_CHECKING:
+    from .ri import WebDriver
+
+URL = "https://lucas.lboro.ac.uk/its_apx/f?p=student_timetable"
+"""The live timetable, it redirects to the sign in page if there is no session."""
+TIMEOUT = 30
+"""Seconds to wait for each page of the timetable."""
+RETRIES = 3
+"""Times a page is retried after the server is rate limiting or failing, HTTP 429 or 5xx."""
+SIGNED_OUT = frozenset({301, 302, 303, 307, 308, 401, 403})
+"""HTTP statuses of a session the server no longer accepts, redirects only fail here if they loop back to sign in."""
+
+
+class FetchError(Exception):
+    """The timetable could not be fetched without a browser."""
+
+
+class SessionExpired(FetchError):
+    """The saved session was not accepted, the user has to sign in with a browser again."""
+
+
+@dataclass
+class Session:
+    """The cookies of a signed in browser, used to fetch the timetable without one.
+
+    Attributes:
+        cookies: The browser's cookies, in the form returned by `WebDriver.get_cookies`.
+        user_agent: The browser's user agent, sent with every request."""
+
+    cookies: list[dict[str, Any]] = field(default_factory=list)
+    user_agent: str | None = None
+
+    @classmethod
+    def from_driver(cls, driver: "WebDriver") -> Self:
+        return cls(driver.get_cookies(), driver.execute_script("return navigator.userAgent"))
+
+    @classmethod
+    def load(cls, filepath: Path) -> Self | None:
+        """Load a saved session, returning `None` if there is none."""
+        try:
+            data = json.loads(filepath.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        return cls(data.get("cookies", []), data.get("userAgent"))
+
+    def save(self, filepath: Path) -> None:
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        tmp = filepath.with_name(filepath.name + ".tmp")
+        tmp.write_text(json.dumps({"cookies": self.cookies, "userAgent": self.user_agent}))
+        tmp.replace(filepath)
+
+    def jar(self) -> http.cookiejar.CookieJar:
+        jar = http.cookiejar.CookieJar()
+        for cookie in self.cookies:
+            jar.set_cookie(_to_cookie(cookie))
+        return jar
+
+    def update(self, jar: http.cookiejar.CookieJar) -> None:
+        """Replace the cookies with those in `jar`, keeping any the server has refreshed."""
+        self.cookies = [_from_cookie(cookie) for cookie in jar]
+
+
+def _to_cookie(cookie: dict[str, Any]) -> http.cookiejar.Cookie:
+    domain: str = cookie.get("domain", "")
+    return http.cookiejar.Cookie(
+        version=0,
+        name=cookie["name"],
+        value=cookie["value"],
+        port=None,
+        port_specified=False,
+        domain=domain,
+        domain_specified=bool(domain),
+        domain_initial_dot=domain.startswith("."),
+        path=cookie.get("path", "/"),
+        path_specified=True,
+        secure=cookie.get("secure", False),
+        expires=cookie.get("expiry"),
+        discard="expiry" not in cookie,
+        comment=None,
+        comment_url=None,
+        rest={"HttpOnly": ""} if cookie.get("httpOnly") else {},
+    )
+
+
+def _from_cookie(cookie: http.cookiejar.Cookie) -> dict[str, Any]:
+    data: dict[str, Any] = {
+        "name": cookie.name,
+        "value": cookie.value,
+        "domain": cookie.domain,
+        "path": cookie.path,
+        "secure": cookie.secure,
+        "httpOnly": cookie.has_nonstandard_attr("HttpOnly"),
+    }
+    if cookie.expires is not None:
+        data["expiry"] = cookie.expires
+    return data
+
+
+def filepath(cache_dir: Path) -> Path:
+    return cache_dir / "session.json"
+
+
+class Client:
+    """Fetches the pages of the timetable over HTTP with the cookies of a `Session`."""
+
+    def __init__(self, session: Session) -> None:
+        self.session = session
+        self.cookies = session.jar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        if session.user_agent:
+            self.opener.addheaders = [("User-Agent", session.user_agent)]
+
+    def get(self, url: str) -> tuple[str, page.Element]:
+        """Fetch the timetable page at `url`.
+
+        Returns:
+            The HTML source of the page and the parsed page.
+
+        Raises:
+            SessionExpired: The server asked to sign in again, or did not return the timetable.
+            FetchError: The server could not be reached, or kept failing after `RETRIES` retries."""
+        for attempt in itertools.count():
+            log.debug("GET %s", url)
+            try:
+                with self.opener.open(url, timeout=TIMEOUT) as res:
+                    src = res.read().decode(res.headers.get_content_charset() or "utf-8")
+                break
+            except urllib.error.HTTPError as exc:
+                if exc.code in SIGNED_OUT:
+                    raise SessionExpired(f"Timetable returned HTTP {exc.code}") from exc
+                if attempt >= RETRIES or not (exc.code == 429 or exc.code >= 500):
+                    raise FetchError(f"Timetable returned HTTP {exc.code}") from exc
+                retry_after = exc.headers.get("Retry-After", "")
+                delay = min(float(retry_after), 60) if retry_after.isdigit() else 2**attempt
+                log.warning("Timetable returned HTTP %d, retrying in %.0fs", exc.code, delay)
+                time.sleep(delay)
+            except (urllib.error.URLError, TimeoutError) as exc:
+                raise FetchError(f"Timetable could not be reached: {exc}") from exc
+        document = page.parse(src)
+        if document.by_id("timetable") is None or document.by_id("P2_MY_PERIOD") is None:
+            raise SessionExpired("Timetable redirected to the sign in page")
+        return src, document
+
+
+def _apex_url(document: page.Element, **items: str) -> str:
+    # Oracle APEX sets page items from the URL: f?p=App:Page:Session:Request:Debug:ClearCache:Items:Values
+    def hidden(eid: str) -> str:
+        if (element := document.by_id(eid)) is None or not (value := element.attrs.get("value")):
+            raise FetchError(f"Timetable page has no {eid}")
+        return value
+
+    app, step, instance = hidden("pFlowId"), hidden("pFlowStepId"), hidden("pInstance")
+    p = f"{app}:{step}:{instance}::NO::{','.join(items)}:{','.join(items.values())}"
+    return urllib.parse.urljoin(URL, "f?" + urllib.parse.urlencode({"p": p}, safe=":,"))
+
+
+def semester_options(document: page.Element) -> dict[int, page.Element]:
+    """The options of the week selector that show a whole semester, by semester ID."""
+    selector = document.by_id("P2_MY_PERIOD")
+    options = (option for option in selector.iter() if option.tag == "option") if selector else ()
+    return {
+        int(name.split()[-1]): option for option in options if (name := option.text().lower()).startswith("semester")
+    }
+
+
+def fetch_semesters(session: Session, cache_dir: Path) -> list[int]:
+    """Save every semester page of the timetable to `cache_dir`, without a browser.
+
+    The session's cookies are updated with any the server refreshes.
+
+    Returns:
+        The IDs of the saved semesters.
+
+    Raises:
+        SessionExpired: The server did not accept the session.
+        FetchError: The server could not be reached, or did not select a semester."""
+    client = Client(session)
+    log.info("Fetching timetable with saved session: %s", URL)
+    _, document = client.get(URL)
+    semesters = semester_options(document)
+    if not semesters:
+        raise FetchError("Timetable has no semesters to select")
+
+    pages: dict[int, str] = {}
+    for semester, option in semesters.items():
+        src, selected = client.get(_apex_url(document, P2_MY_PERIOD=option.attrs.get("value", "")))
+        chosen = semester_options(selected).get(semester)
+        if chosen is None or "selected" not in chosen.attrs:
+            raise FetchError(f"Timetable did not select semester {semester}")
+        pages[semester] = src
+        document = selected
+
+    # Only replace the cache once every page was fetched, so a failure leaves it consistent
+    cache_dir.mkdir(exist_ok=True, parents=True)
+    for semester, src in pages.items():
+        (cache_dir / f"{semester}.html").write_text(src)
+    (cache_dir / "meta.cache").write_text(datetime.datetime.now(datetime.timezone.utc).isoformat())
+    session.update(client.cookies)
+    return list(pages)
@@ -0,0 +1,131 @@
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Any, Self, overload
+
+from .dates import DateSet
+from .event import EventInstance, EventSchedule, GroupID
+
+
+class EventStore(Sequence[EventSchedule]):
+    """Columnar storage for many events.
+
+    Each distinct `EventInstance` is stored once and referred to by an integer id, as is each distinct `GroupID`.
+    The dates of every event are stored as ordinals in a single array, with `offsets` marking where each event's
+    dates start. Events are materialised as `EventSchedule` when they are accessed.
+
+    The lookups from instances and groups to their ids are only needed to add events, they can be dropped with
+    `compact` and are not pickled. They are rebuilt when an event is next added."""
+
+    def __init__(self) -> None:
+        self.instances: list[EventInstance] = []
+        """Distinct instances, indexed by instance id."""
+        self.groups: list[GroupID] = []
+        """Distinct groups, indexed by group id."""
+        self.group_of = array("I")
+        """Group id of each instance id."""
+        self.ids: list[str | None] = []
+        self.instance = array("I")
+        """Instance id of each event."""
+        self.offsets = array("I", (0,))
+        """Start of each event's dates in `dates`, followed by the end of the last event."""
+        self.dates = array("i")
+        """Date ordinals of every event."""
+        self._instance_ids: dict[EventInstance, int] | None = {}
+        self._group_ids: dict[GroupID, int] | None = {}
+
+    @classmethod
+    def from_events(cls, events: Iterable[EventSchedule]) -> Self:
+        store = cls()
+        store.extend(events)
+        return store
+
+    @classmethod
+    def merged(cls, events: Iterable[EventSchedule]) -> Self:
+        """Store `events`, combining the events that share a `GroupID`.
+
+        Each group keeps the instance of its first event, groups are in the order they were first seen.
+        The IDs of the events are not preserved."""
+        store = cls()
+        merged: dict[int, tuple[int, DateSet]] = {}
+        for event in events:
+            iid = store.intern(event.instance)
+            if (entry := merged.get(gid := store.group_of[iid])) is None:
+                merged[gid] = (iid, event.on_dates)
+            else:
+                merged[gid] = (entry[0], entry[1] | event.on_dates)
+        for iid, dates in merged.values():
+            store._append(None, iid, dates.ordinals())
+        return store
+
+    def intern(self, instance: EventInstance) -> int:
+        """The id of `instance`, adding it to the store if it is new."""
+        if self._instance_ids is None or self._group_ids is None:
+            self._instance_ids = {known: iid for iid, known in enumerate(self.instances)}
+            self._group_ids = {group: gid for gid, group in enumerate(self.groups)}
+        if (iid := self._instance_ids.get(instance)) is None:
+            iid = self._instance_ids[instance] = len(self.instances)
+            self.instances.append(instance.intern())
+            group = instance.group()
+            if (gid := self._group_ids.get(group)) is None:
+                gid = self._group_ids[group] = len(self.groups)
+                self.groups.append(group)
+            self.group_of.append(gid)
+        return iid
+
+    def compact(self) -> Self:
+        """Drop the lookups used to add events, for a store that is only read."""
+        self._instance_ids = self._group_ids = None
+        return self
+
+    def __getstate__(self) -> dict[str, Any]:
+        # The groups are those of the instances, pickling them would unpickle a second copy of each
+        return self.__dict__ | {"groups": None, "_instance_ids": None, "_group_ids": None}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        # Group ids are given in the order their first instance was added
+        groups: dict[int, GroupID] = {}
+        for iid, gid in enumerate(self.group_of):
+            if gid not in groups:
+                groups[gid] = self.instances[iid].group()
+        self.groups = list(groups.values())
+
+    def append(self, event: EventSchedule) -> None:
+        self._append(event.id(), self.intern(event.instance), event.on_dates.ordinals())
+
+    def _append(self, eid: str | None, iid: int, ordinals: Iterable[int]) -> None:
+        self.ids.append(eid)
+        self.instance.append(iid)
+        self.dates.extend(ordinals)
+        self.offsets.append(len(self.dates))
+
+    def extend(self, events: Iterable[EventSchedule]) -> None:
+        for event in events:
+            self.append(event)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @overload
+    def __getitem__(self, index: int) -> EventSchedule: ...
+    @overload
+    def __getitem__(self, index: slice) -> list[EventSchedule]: ...
+    def __getitem__(self, index: int | slice) -> EventSchedule | list[EventSchedule]:
+        if isinstance(index, slice):
+            return [self._event(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("EventStore index out of range")
+        return self._event(index)
+
+    def __iter__(self) -> Iterator[EventSchedule]:
+        return map(self._event, range(len(self)))
+
+    def _event(self, index: int) -> EventSchedule:
+        ordinals = self.dates[self.offsets[index] : self.offsets[index + 1]]
+        return EventSchedule(self.ids[index], self.instances[self.instance[index]], DateSet.from_ordinals(ordinals))
+
+    def group_id(self, index: int) -> int:
+        """The group id of the event at `index`."""
+        return self.group_of[self.instance[index]]
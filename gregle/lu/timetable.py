@@ -0,0 +1,263 @@
+import abc
+import datetime
+import re
+from collections.abc import Iterable
+from typing import Any, Self
+
+from .. import tz
+from ..log import log
+from .dates import DateSet
+from .event import EventInstance, EventSchedule
+
+RE_WEEK = re.compile(r"Sem\s*(\d+)\s*-\s*Wk\s*(\d+)\s*\(starting\s*(\d{2}-\w{3}-\d{4})\)", re.I)
+"""Regex to match a week name in the timetable's selector dropdown
+
+- Semester ID
+- Week ID
+- Week Start Date"""
+
+type SemWk = tuple[int, int]
+"""Semester and Week ID"""
+type SemWks = set[SemWk]
+"""Set of weeks that an event repeats on"""
+type WeekMap = dict[SemWk, datetime.date]
+"""Start date of each week in the timetable"""
+
+
+class Node(abc.ABC):
+    """An element of the timetable page, independent of how the page was loaded."""
+
+    @abc.abstractmethod
+    def attribute(self, name: str) -> str | None:
+        """The value of an HTML attribute."""
+        ...
+
+    @abc.abstractmethod
+    def text(self) -> str:
+        """The rendered text content of the element."""
+        ...
+
+    @abc.abstractmethod
+    def html(self) -> str:
+        """The HTML source of the element's content."""
+        ...
+
+    @abc.abstractmethod
+    def find(self, class_name: str) -> Self | None:
+        """The first descendant with the class `class_name`."""
+        ...
+
+    @abc.abstractmethod
+    def find_all(self, class_name: str) -> list[Self]:
+        """All descendants with the class `class_name`."""
+        ...
+
+    @abc.abstractmethod
+    def children(self, tag: str) -> list[Self]:
+        """The direct children with the tag name `tag`."""
+        ...
+
+    @abc.abstractmethod
+    def describe(self) -> str:
+        """A short CSS selector like description of the element."""
+        ...
+
+
+class DataNode(Node):
+    """A `Node` built from a serialised description of an element.
+
+    The description is a JSON object with the optional keys:
+    - attrs: The HTML attributes by name
+    - text: The `innerText`
+    - html: The `innerHTML`
+    - find: The first descendant by class name
+    - find_all: All descendants by class name
+    - children: The direct children by tag name"""
+
+    def __init__(self, data: dict[str, Any]) -> None:
+        self.data = data
+
+    def attribute(self, name: str) -> str | None:
+        return self.data.get("attrs", {}).get(name)
+
+    def text(self) -> str:
+        return self.data.get("text") or ""
+
+    def html(self) -> str:
+        return self.data.get("html") or ""
+
+    def find(self, class_name: str) -> Self | None:
+        node = self.data.get("find", {}).get(class_name)
+        return None if node is None else type(self)(node)
+
+    def find_all(self, class_name: str) -> list[Self]:
+        return [type(self)(node) for node in self.data.get("find_all", {}).get(class_name, [])]
+
+    def children(self, tag: str) -> list[Self]:
+        return [type(self)(node) for node in self.data.get("children", {}).get(tag, [])]
+
+    def describe(self) -> str:
+        classes = ".".join((self.attribute("class") or "").split())
+        return f".{classes}" if classes else "<node>"
+
+
+def parse_week(name: str) -> tuple[int, int, datetime.date] | None:
+    """Parse a week name from the timetable's selector dropdown.
+
+    Returns:
+        The semester ID, week ID and start date of the week, or `None` if `name` is not a week."""
+    if (m := RE_WEEK.match(name)) is None:
+        return None
+    date = datetime.datetime.strptime(m[3], "%d-%b-%Y").date()  # noqa: DTZ007
+    return int(m[1]), int(m[2]), date
+
+
+def week_map(names: Iterable[str]) -> WeekMap:
+    """Map the weeks in the timetable's selector dropdown to their start dates."""
+    weeks: WeekMap = {}
+    for name in names:
+        if (week := parse_week(name.lower())) is not None:
+            sem, wk, date = week
+            weeks[(sem, wk)] = date
+    return weeks
+
+
+def extract_repeated_weeks(text: str, weeks: WeekMap, weekday: int = 0) -> DateSet:
+    """Extract the dates that an event repeats on from the timetable.
+
+    Args:
+        text: The weeks of the event, as shown on the timetable.
+        weeks: A mapping of the weeks in the timetable to dates.
+        weekday: The day of the week the event is on.
+
+    Returns:
+        The date of the event in each week it repeats on."""
+    PREFIX = "weeks:"
+    text = text.lstrip(PREFIX).lstrip()
+    # Set a bit for each week after the earliest, then shift them all onto the weekday at once
+    anchor = min(weeks.values(), default=datetime.date.min).toordinal()
+    mask = 0
+    for sem_data in text.split("sem"):
+        sem_data = sem_data.strip()
+        if not sem_data:
+            continue
+        sem_name, wks = map(str.strip, sem_data.split(":"))
+        sem = int(sem_name)
+        for rng in wks.split(","):
+            rng = rng.strip()
+            if "-" in rng:
+                lhs, rhs = (int(s.strip()) for s in rng.split("-"))
+            else:
+                lhs = rhs = int(rng)
+            for wk in range(lhs, rhs + 1):
+                mask |= 1 << (weeks[(sem, wk)].toordinal() - anchor)
+    return DateSet.from_mask(anchor + weekday, mask)
+
+
+def event_from_node(node: Node, start: datetime.datetime, weeks: WeekMap) -> EventSchedule:
+    """Extract an event from a node in the timetable.
+
+    Args:
+        node: The `Node` representing the event.
+        start: The `datetime` of the start of the event.
+        weeks: A mapping of the weeks in the timetable to dates.
+
+    Returns:
+        An `EventSchedule` instance representing the event."""
+
+    def get_content_of(class_name: str) -> str | None:
+        if (child := node.find(class_name)) is None:
+            log.error("Failed to find element '.%s' on node %s", class_name, node.describe())
+            return None
+        return child.text()
+
+    def remove_ellipsis(string: str) -> str:
+        if string.endswith("..."):
+            string = string[: -len("...")]
+        return string
+
+    def split(string: str) -> tuple[str, ...]:
+        s = {ss for s in remove_ellipsis(string).split(",") if (ss := s.strip())}
+        return tuple(sorted(s - {"..."}))
+
+    duration = int(node.attribute("colspan") or "") // 2  # hours
+    module_codes = split(get_content_of("tt_module_id_row") or "")
+    module_name = remove_ellipsis(get_content_of("tt_module_name_row") or "")
+    lecturers = split(get_content_of("tt_lect_row") or "")
+    rooms = split(get_content_of("tt_room_row") or "")
+    content_type = get_content_of("tt_modtype_row")
+
+    event = EventInstance(
+        module_codes,
+        module_name or "",
+        rooms,
+        lecturers,
+        content_type or "",
+        start.time(),
+        datetime.timedelta(hours=duration),
+    ).intern()
+    on_dates = extract_repeated_weeks((get_content_of("tt_weeks_row") or "").lower(), weeks, start.weekday())
+
+    return EventSchedule(None, event, on_dates)
+
+
+def events_from_weekday(
+    nodes: list[Node],
+    weekday: int,
+    weeks: WeekMap,
+) -> list[EventSchedule]:
+    """Extract events from a weekday in the timetable.
+
+    Args:
+        nodes: The list of `Node`s representing columns in the timetable for a single weekday.
+        weekday: The index of the weekday in the timetable. 0 is Monday.
+        weeks: A mapping of the weeks in the timetable to dates.
+
+    Returns:
+        A list of `EventSchedule` instances representing the events on the weekday."""
+    events: list[EventSchedule] = []
+
+    loc = -1  # Offset -1 as we pre increment
+    for node in nodes:
+        loc += 1
+        if "tt_info_cell" not in (node.attribute("class") or ""):
+            continue
+        dt = datetime.timedelta(days=weekday, hours=loc / 2)
+        # 2000-01-03 is a Monday, so we can add the weekday to get the correct day
+        day = datetime.datetime.combine(datetime.date(2000, 1, 3), datetime.time(hour=9), tz.DEFAULT)
+        event = event_from_node(node, day + dt, weeks)
+        loc += (event.instance.duration.total_seconds() / 60 / 60) * 2 - 1
+        events.append(event)
+
+    return events
+
+
+def events_from_table(table: Node, weeks: WeekMap) -> list[EventSchedule]:
+    """Extract events from the `#timetable_details` table.
+
+    Args:
+        table: The `Node` of the timetable.
+        weeks: A mapping of the weeks in the timetable to dates.
+
+    Returns:
+        A list of `EventSchedule` instances representing the events in the timetable."""
+    events: list[EventSchedule] = []
+    weekday = -1
+    weekdays = iter(table.find_all("tt_info_row"))
+    for row in weekdays:
+        nodes = row.children("td")
+
+        if "weekday_col" not in (nodes[0].attribute("class") or ""):
+            continue
+        if "on demand" in nodes[0].html().lower():
+            continue
+        weekday += 1
+
+        # The number of rows this weekday spans
+        rows = int(nodes[0].attribute("rowspan") or "")
+
+        events.extend(events_from_weekday(nodes[1:], weekday, weeks))
+        for _ in range(rows - 1):
+            events.extend(events_from_weekday(next(weekdays).children("td"), weekday, weeks))
+
+    return events
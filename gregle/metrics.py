@@ -0,0 +1,179 @@
+import contextlib
+import json
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+from .log import log
+
+type Labels = tuple[tuple[str, str], ...]
+
+HELP = {
+    "gregle_stage_seconds": "Time spent in each stage of a sync",
+    "gregle_api_requests_total": "Calendar API calls made, by API method",
+    "gregle_api_errors_total": "Calendar API calls that failed, by API method and HTTP status",
+    "gregle_api_retries_total": "Calendar API calls retried after a transient failure, by API method",
+    "gregle_api_round_trips_total": "HTTP requests made to the Calendar API, a batch is a single round trip",
+    "gregle_api_bytes_sent_total": "Bytes of request bodies sent to the Calendar API",
+    "gregle_api_bytes_received_total": "Bytes of response bodies received from the Calendar API",
+    "gregle_cache_hits_total": "Cache lookups that were fresh, by cache",
+    "gregle_cache_misses_total": "Cache lookups that had to be recomputed, by cache",
+    "gregle_events": "Number of events, by source",
+    "gregle_event_dates": "Number of dates the events are on, by source",
+    "gregle_changes_total": "Changes applied to the calendar, by kind and outcome",
+    "gregle_last_run_timestamp_seconds": "Unix time the metrics were exported",
+}
+"""Description of each metric, used as the HELP line of the Prometheus export."""
+
+
+class Metrics:
+    """Counters, gauges and timings of a run, exportable as JSON and in the Prometheus text format.
+
+    Metrics are identified by their name and labels. It is thread-safe."""
+
+    def __init__(self) -> None:
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.gauges: dict[str, dict[Labels, float]] = {}
+        self.timings: dict[str, dict[Labels, tuple[float, int]]] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, value: float = 1, **labels: str) -> None:
+        """Add `value` to a counter."""
+        key = _labels(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """Set a gauge to `value`."""
+        with self._lock:
+            self.gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        """Record a duration."""
+        key = _labels(labels)
+        with self._lock:
+            series = self.timings.setdefault(name, {})
+            total, n = series.get(key, (0.0, 0))
+            series[key] = (total + seconds, n + 1)
+
+    @contextlib.contextmanager
+    def time(self, name: str, **labels: str) -> Iterator[None]:
+        """Record the duration of the block, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextlib.contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Record the duration of a stage of the sync."""
+        log.debug("Stage %s started", stage)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe("gregle_stage_seconds", seconds, stage=stage)
+            log.debug("Stage %s took %.3fs", stage, seconds)
+
+    def iterate[T](self, stage: str, iterable: Iterable[T]) -> Iterator[T]:
+        """Yield the items of `iterable`, recording the time spent producing them as a stage of the sync.
+
+        Unlike `stage`, the time the consumer spends between items is not included."""
+        iterator = iter(iterable)
+        seconds = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - start
+                yield item
+        finally:
+            self.observe("gregle_stage_seconds", seconds, stage=stage)
+            log.debug("Stage %s took %.3fs", stage, seconds)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.timings.clear()
+
+    def as_dict(self) -> dict[str, Any]:
+        def series(metrics: dict[str, dict[Labels, Any]], value: Any) -> dict[str, list[dict[str, Any]]]:
+            return {
+                name: [{"labels": dict(labels), **value(v)} for labels, v in sorted(values.items())]
+                for name, values in sorted(metrics.items())
+            }
+
+        with self._lock:
+            return {
+                "counters": series(self.counters, lambda v: {"value": v}),
+                "gauges": series(self.gauges, lambda v: {"value": v}),
+                "timings": series(self.timings, lambda v: {"sum": v[0], "count": v[1]}),
+            }
+
+    def prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+
+        def header(name: str, kind: str) -> None:
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, counts in sorted(self.counters.items()):
+                header(name, "counter")
+                lines.extend(f"{name}{_format(labels)} {_number(v)}" for labels, v in sorted(counts.items()))
+            for name, levels in sorted(self.gauges.items()):
+                header(name, "gauge")
+                lines.extend(f"{name}{_format(labels)} {_number(v)}" for labels, v in sorted(levels.items()))
+            for name, summaries in sorted(self.timings.items()):
+                header(name, "summary")
+                for labels, (total, n) in sorted(summaries.items()):
+                    lines.append(f"{name}_sum{_format(labels)} {_number(total)}")
+                    lines.append(f"{name}_count{_format(labels)} {n}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, prefix: Path) -> tuple[Path, Path]:
+        """Write the metrics to `{prefix}.json` and `{prefix}.prom`.
+
+        Returns:
+            The paths of the JSON and Prometheus files."""
+        self.set("gregle_last_run_timestamp_seconds", time.time())
+        prefix.parent.mkdir(parents=True, exist_ok=True)
+        json_file, prom_file = prefix.with_name(f"{prefix.name}.json"), prefix.with_name(f"{prefix.name}.prom")
+        for filepath, content in ((json_file, json.dumps(self.as_dict(), indent=2)), (prom_file, self.prometheus())):
+            # Write then rename, so a collector never reads a partial file
+            tmp = filepath.with_name(filepath.name + ".tmp")
+            tmp.write_text(content)
+            tmp.replace(filepath)
+        log.info("Exported metrics to %s and %s", json_file, prom_file)
+        return json_file, prom_file
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped, strict=True)) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+metrics = Metrics()
+"""The metrics of the current run."""
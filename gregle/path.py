@@ -8,5 +8,6 @@ def new(path: Path) -> Path:
 
 CODE = Path(__file__).parent
 ROOT = CODE.parent
-RES = new(ROOT / "res")
-CACHE = new(ROOT / "cache")
+RES = ROOT / "res"
+CACHE = ROOT / "cache"
+"""Directory of cached data, it is created by whatever first writes to it."""
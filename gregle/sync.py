@@ -0,0 +1,295 @@
+import asyncio
+import contextlib
+import datetime
+import json
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Self
+
+from . import gcal, lu
+from . import path as PATH
+from .event import Diff, Event, datespan
+from .log import log
+from .lu.address import digest as rooms_digest
+from .metrics import metrics
+
+
+@dataclass(frozen=True)
+class Profile:
+    """A timetable to sync into a Google account's calendar.
+
+    Attributes:
+        name: Identifies the profile in reports.
+        cache_dir: Directory of the profile's cached timetable pages and calendar mirror.
+        token_file: The saved Google credentials of the account.
+        client_secret: The OAuth client secrets.
+        calendar: The name of the calendar to sync into."""
+
+    name: str
+    cache_dir: Path
+    token_file: Path
+    client_secret: Path
+    calendar: str = "Timetable"
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any], root: Path) -> Self:
+        """Load a profile, resolving relative paths against `root`."""
+        cache_dir = root / data["cache_dir"]
+        token_file = root / data["token_file"] if "token_file" in data else cache_dir / "token.json"
+        client_secret = root / data["client_secret"] if "client_secret" in data else PATH.RES / "client_secret.json"
+        return cls(data["name"], cache_dir, token_file, client_secret, data.get("calendar", "Timetable"))
+
+
+def load_profiles(filepath: Path) -> list[Profile]:
+    """Load the profiles from a JSON file containing a list of profile objects."""
+    return [Profile.from_dict(data, filepath.parent) for data in json.loads(filepath.read_text())]
+
+
+@dataclass
+class SyncState:
+    """What the last successful sync of a calendar saw, so that a sync can be skipped when nothing has changed since.
+
+    Attributes:
+        calendar: The ID of the synced calendar.
+        sync_token: The sync token of the calendar's mirror, once the changes made by the sync had been fetched.
+        pages: The `lu.page.digest` of each cached timetable page by semester ID.
+        events: The `lu.ri.events_digest` of the timetable events.
+        window: The dates that were synced, `None` if every date was.
+        span: The dates of the timetable events.
+        encoding: The `encoding` the events were written with."""
+
+    calendar: str | None = None
+    sync_token: str | None = None
+    pages: dict[str, str] = field(default_factory=dict)
+    events: str | None = None
+    window: tuple[datetime.date, datetime.date] | None = None
+    span: tuple[datetime.date, datetime.date] | None = None
+    encoding: str | None = None
+
+    @classmethod
+    def load(cls, filepath: Path) -> Self:
+        """Load the state, returning an empty state if there is none."""
+        try:
+            data = json.loads(filepath.read_text())
+            return cls(
+                data["calendar"],
+                data["syncToken"],
+                data["pages"],
+                data["events"],
+                _dates(data["window"]),
+                _dates(data["span"]),
+                data["encoding"],
+            )
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return cls()
+
+    def save(self, filepath: Path) -> None:
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "calendar": self.calendar,
+            "syncToken": self.sync_token,
+            "pages": self.pages,
+            "events": self.events,
+            "window": None if self.window is None else [date.isoformat() for date in self.window],
+            "span": None if self.span is None else [date.isoformat() for date in self.span],
+            "encoding": self.encoding,
+        }
+        tmp = filepath.with_name(filepath.name + ".tmp")
+        tmp.write_text(json.dumps(data))
+        tmp.replace(filepath)
+
+    def covers(self, window: tuple[datetime.date, datetime.date] | None) -> bool:
+        """Whether the last sync included every date of the `window`, `None` for every date."""
+        if self.window is None:
+            return True
+        if window is None:
+            return False
+        return self.window[0] <= window[0] and window[1] <= self.window[1]
+
+
+def encoding() -> str:
+    """What encoding the events depends on besides the timetable, a recorded sync is only up to date while it holds.
+
+    This is the version of the encoding and the room directory the addresses of the events are found in."""
+    return f"gcal-{gcal.event.ENCODING}:rooms-{rooms_digest()}"
+
+
+def _dates(data: list[str] | None) -> tuple[datetime.date, datetime.date] | None:
+    if data is None:
+        return None
+    start, end = map(datetime.date.fromisoformat, data)
+    return start, end
+
+
+@dataclass
+class Report:
+    """The outcome of syncing a single profile."""
+
+    profile: Profile
+    applied: Counter[str] = field(default_factory=Counter)
+    failed: Counter[str] = field(default_factory=Counter)
+    error: BaseException | None = None
+    duration: datetime.timedelta = datetime.timedelta()
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.failed
+
+    def summary(self) -> str:
+        if self.error is not None:
+            return f"{self.profile.name}: failed after {self.duration} - {self.error!r}"
+        applied = ", ".join(f"{n} {kind}" for kind, n in sorted(self.applied.items())) or "no changes"
+        failed = ", ".join(f"{n} {kind}" for kind, n in sorted(self.failed.items()))
+        return f"{self.profile.name}: {applied}{f', failed {failed}' if failed else ''} in {self.duration}"
+
+
+class SyncService:
+    """Sync many profiles concurrently.
+
+    Blocking work runs on threads. The number of API requests in flight is limited globally and per account.
+    Each account uses its own pool of authorised transports, as `httplib2` connections are not thread-safe.
+
+    Args:
+        dry_run: Do not make any changes to the calendars.
+        concurrency: Maximum number of API requests in flight across all profiles.
+        per_account: Maximum number of API requests in flight for a single profile.
+        quota: The daily usage tracker shared by all profiles."""
+
+    def __init__(
+        self,
+        *,
+        dry_run: bool,
+        concurrency: int = 16,
+        per_account: int = 4,
+        quota: gcal.executor.Quota | None = None,
+    ) -> None:
+        self.dry_run = dry_run
+        self.per_account = per_account
+        self.quota = gcal.executor.Quota(PATH.CACHE / "quota.json") if quota is None else quota
+        self._limit = asyncio.Semaphore(concurrency)
+
+    async def run(self, profiles: Iterable[Profile]) -> list[Report]:
+        """Sync every profile, returning a report for each in the same order."""
+        try:
+            return await asyncio.gather(*(self.sync(profile) for profile in profiles))
+        finally:
+            if not self.dry_run:
+                self.quota.save()
+
+    async def sync(self, profile: Profile) -> Report:
+        report = Report(profile)
+        start = time.perf_counter()
+        try:
+            await self._sync(profile, report)
+        except Exception as exc:
+            log.error("Failed to sync %s", profile.name, exc_info=exc)
+            report.error = exc
+        report.duration = datetime.timedelta(seconds=round(time.perf_counter() - start, 3))
+        log.info("Synced %s", report.summary())
+        return report
+
+    async def _call[R](self, func: Callable[..., R], *args: Any) -> R:
+        async with self._limit:
+            return await asyncio.to_thread(func, *args)
+
+    async def _sync(self, profile: Profile, report: Report) -> None:
+        local = await asyncio.to_thread(_events_local, profile)
+        if not local:
+            log.warning("Profile %s has no timetable events", profile.name)
+            return
+        date_range = datespan(local)
+
+        api = await self._call(gcal.service.calendar, profile.token_file, profile.client_secret)
+        with contextlib.closing(api):
+            calendar = await self._call(gcal.cal.get_calendar, api, profile.calendar)
+            remote = await self._call(_events_remote, api, calendar, profile.cache_dir, date_range)
+            changes = await asyncio.to_thread(_changes, remote, local)
+            await self._apply(api, calendar, changes, report)
+
+    async def _apply(
+        self, api: gcal.service.API, calendar: gcal.service.Calendar, changes: list[Diff[Event]], report: Report
+    ) -> None:
+        prepared = [p for change in changes if (p := gcal.cal.prepare(api, calendar, change)) is not None]
+        if self.dry_run:
+            report.applied.update(mutation.change[0] for mutation, _ in prepared)
+            return
+
+        gate = asyncio.Semaphore(self.per_account)
+        pool = gcal.service.HttpPool(api, min(self.per_account, len(prepared)))
+        limiter = gcal.executor.TokenBucket(gcal.executor.RATE_LIMIT)
+
+        def execute(request: Any) -> Any:
+            with pool.acquire() as http:
+                return gcal.executor.execute(request, http=http, limiter=limiter, quota=self.quota)
+
+        async def apply(mutation: gcal.cal.Mutation, request: Any) -> None:
+            # Wait here rather than in the pool, so a waiting request does not hold a thread
+            async with gate:
+                try:
+                    mutation.resolve(await self._call(execute, request))
+                except Exception as exc:
+                    mutation.resolve(None, exc)
+            metrics.count("gregle_changes_total", kind=mutation.change[0], outcome="ok" if mutation.ok else "failed")
+            if mutation.ok:
+                report.applied[mutation.change[0]] += 1
+            else:
+                report.failed[mutation.change[0]] += 1
+                log.error("Failed to %s %s", mutation.change[0], mutation.change[1], exc_info=mutation.error)
+
+        try:
+            await asyncio.gather(*(apply(*p) for p in prepared))
+        finally:
+            pool.close()
+
+
+def _events_local(profile: Profile) -> list[lu.Events]:
+    """Parse the profile's cached timetable pages, fetching them first if they are missing or stale.
+
+    Raises:
+        lu.session.FetchError: The pages are missing or stale, and could not be fetched with the saved session."""
+    cache_dir = profile.cache_dir / "semester"
+    if lu.ri.cached_stale(cache_dir):
+        with metrics.stage("scrape"):
+            fetched = lu.ri.fetch_pages(cache_dir)
+        if not fetched:
+            raise lu.session.FetchError(
+                f"Timetable pages in {cache_dir} are missing or stale, and could not be fetched with the saved session"
+            )
+    with metrics.stage("parse"):
+        return lu.ri.dedupe_events(lu.ri.events_from_cache(cache_dir))
+
+
+def _events_remote(
+    api: gcal.service.API,
+    calendar: gcal.service.Calendar,
+    cache_dir: Path,
+    date_range: tuple[datetime.date, datetime.date],
+) -> list[gcal.Event]:
+    with metrics.stage("fetch"):
+        filepath = gcal.mirror.filepath(calendar, cache_dir)
+        mirror = gcal.mirror.sync(api, gcal.mirror.Mirror.load(filepath, calendar))
+        mirror.save(filepath)
+        return list(mirror.events(*date_range))
+
+
+def _changes(remote: list[gcal.Event], local: list[lu.Events]) -> list[Diff[Event]]:
+    """Diff the remote and local events, deleting any remote events that cannot be decoded."""
+    with metrics.stage("diff"):
+        return _diff(remote, local)
+
+
+def _diff(remote: list[gcal.Event], local: list[lu.Events]) -> list[Diff[Event]]:
+    stale, remote, local = gcal.event.match_fingerprints(remote, local)
+    decoded: list[lu.Events] = []
+    changes: list[Diff[Event]] = [("delete", event) for event in stale]
+    for event in remote:
+        try:
+            decoded.append(lu.Events.from_event(event))
+        except Exception as exc:
+            log.error("Failed to convert event %s", event, exc_info=exc)
+            changes.append(("delete", event))
+    changes.extend(lu.diff(decoded, local))
+    return changes
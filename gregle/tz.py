@@ -2,3 +2,5 @@ from zoneinfo import ZoneInfo
 
 LONDON = ZoneInfo("Europe/London")
 DEFAULT = LONDON
+PACIFIC = ZoneInfo("America/Los_Angeles")
+"""Google API quotas reset at midnight Pacific Time."""